@@ -1,136 +1,123 @@
-import json
-import os
-import hashlib
-import secrets
-from datetime import datetime, timedelta
-import psycopg2
 from psycopg2.extras import RealDictCursor
+from db import PoolExhausted, get_connection, pool_exhausted
+from passwords import HashingOverloaded, hash_password, verify_password
+from tokens import issue_token
+from ratelimit import rate_limiter, client_ip, too_many_requests
+from runtime import METHOD_NOT_ALLOWED, respond, preflight, dispatch, guarded, loads
+from tracing import traced
 
+PREFLIGHT = preflight('GET, POST, OPTIONS')
+
+def user_payload(user: dict) -> dict:
+    return {
+        'id': user['id'],
+        'email': user['email'],
+        'username': user['username'],
+        'subscription_tier': user['subscription_tier'],
+        'created_at': user['created_at'].isoformat() if user['created_at'] else None
+    }
+
+def register(body: dict) -> dict:
+    email = body.get('email')
+    password = body.get('password')
+    username = body.get('username', email.split('@')[0])
+
+    password_hash = hash_password(password)
+
+    with get_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+        cursor.execute('''
+            INSERT INTO t_p58863800_vpn_setup_project.users
+            (email, password_hash, username, subscription_tier)
+            VALUES (%s, %s, %s, %s)
+            RETURNING id, email, username, subscription_tier, created_at
+        ''', (email, password_hash, username, 'premium'))
+
+        user = cursor.fetchone()
+        token = issue_token(user['id'], user['username'], user['subscription_tier'])
+        conn.commit()
+
+    return respond(201, {
+        'success': True,
+        'user': user_payload(user),
+        'token': token,
+        'message': 'Аккаунт успешно создан'
+    })
+
+def login(body: dict) -> dict:
+    '''Хеш проверяется без соединения с базой: пул не простаивает, пока идёт scrypt'''
+    email = body.get('email')
+    password = body.get('password')
+
+    with get_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+        cursor.execute('''
+            SELECT id, email, username, subscription_tier, created_at, password_hash
+            FROM t_p58863800_vpn_setup_project.users
+            WHERE email = %s AND is_active = true
+        ''', (email,))
+
+        user = cursor.fetchone()
+
+    matched, needs_rehash = verify_password(password, user['password_hash'] if user else None)
+
+    if not matched:
+        return respond(401, {
+            'success': False,
+            'message': 'Неверный email или пароль'
+        })
+
+    new_hash = hash_password(password) if needs_rehash else None
+
+    with get_connection() as conn, conn.cursor() as cursor:
+        cursor.execute('''
+            UPDATE t_p58863800_vpn_setup_project.users
+            SET last_login = CURRENT_TIMESTAMP,
+                password_hash = COALESCE(%s, password_hash)
+            WHERE id = %s
+        ''', (new_hash, user['id']))
+        conn.commit()
+
+    return respond(200, {
+        'success': True,
+        'user': user_payload(user),
+        'token': issue_token(user['id'], user['username'], user['subscription_tier']),
+        'message': 'Успешный вход'
+    })
+
+def overloaded(e: HashingOverloaded) -> dict:
+    return respond(503, {'success': False, 'message': str(e)}, {'Retry-After': '1'})
+
+ROUTES = {
+    'register': register,
+    'login': login
+}
+
+@traced('vpn-auth')
+@guarded({HashingOverloaded: overloaded, PoolExhausted: pool_exhausted})
 def handler(event: dict, context) -> dict:
     '''API для регистрации и аутентификации пользователей VPN-сервиса'''
     method = event.get('httpMethod', 'GET')
-    
+
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, Authorization'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
-    
-    try:
-        dsn = os.environ.get('DATABASE_URL')
-        conn = psycopg2.connect(dsn)
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
-        if method == 'POST':
-            body = json.loads(event.get('body', '{}'))
-            action = body.get('action')
-            
-            if action == 'register':
-                email = body.get('email')
-                password = body.get('password')
-                username = body.get('username', email.split('@')[0])
-                
-                password_hash = hashlib.sha256(password.encode()).hexdigest()
-                
-                cursor.execute('''
-                    INSERT INTO t_p58863800_vpn_setup_project.users 
-                    (email, password_hash, username, subscription_tier)
-                    VALUES (%s, %s, %s, %s)
-                    RETURNING id, email, username, subscription_tier, created_at
-                ''', (email, password_hash, username, 'premium'))
-                
-                user = cursor.fetchone()
-                conn.commit()
-                
-                user_data = {
-                    'id': user['id'],
-                    'email': user['email'],
-                    'username': user['username'],
-                    'subscription_tier': user['subscription_tier'],
-                    'created_at': user['created_at'].isoformat() if user['created_at'] else None
-                }
-                
-                return {
-                    'statusCode': 201,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({
-                        'success': True,
-                        'user': user_data,
-                        'message': 'Аккаунт успешно создан'
-                    }),
-                    'isBase64Encoded': False
-                }
-            
-            elif action == 'login':
-                email = body.get('email')
-                password = body.get('password')
-                password_hash = hashlib.sha256(password.encode()).hexdigest()
-                
-                cursor.execute('''
-                    SELECT id, email, username, subscription_tier, created_at
-                    FROM t_p58863800_vpn_setup_project.users
-                    WHERE email = %s AND password_hash = %s AND is_active = true
-                ''', (email, password_hash))
-                
-                user = cursor.fetchone()
-                
-                if user:
-                    cursor.execute('''
-                        UPDATE t_p58863800_vpn_setup_project.users
-                        SET last_login = CURRENT_TIMESTAMP
-                        WHERE id = %s
-                    ''', (user['id'],))
-                    conn.commit()
-                    
-                    user_data = {
-                        'id': user['id'],
-                        'email': user['email'],
-                        'username': user['username'],
-                        'subscription_tier': user['subscription_tier'],
-                        'created_at': user['created_at'].isoformat() if user['created_at'] else None
-                    }
-                    
-                    return {
-                        'statusCode': 200,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({
-                            'success': True,
-                            'user': user_data,
-                            'message': 'Успешный вход'
-                        }),
-                        'isBase64Encoded': False
-                    }
-                else:
-                    return {
-                        'statusCode': 401,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({
-                            'success': False,
-                            'message': 'Неверный email или пароль'
-                        }),
-                        'isBase64Encoded': False
-                    }
-        
-        cursor.close()
-        conn.close()
-        
-        return {
-            'statusCode': 405,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Method not allowed'}),
-            'isBase64Encoded': False
-        }
-        
-    except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
\ No newline at end of file
+        return PREFLIGHT
+
+    if method != 'POST':
+        return METHOD_NOT_ALLOWED
+
+    body = loads(event.get('body') or '{}')
+    action = body.get('action')
+
+    if action not in ROUTES:
+        return METHOD_NOT_ALLOWED
+
+    ip = client_ip(event)
+
+    allowed, retry_after, _ = rate_limiter.check_local(action, user_id=body.get('email'), ip=ip)
+    if not allowed:
+        return too_many_requests(retry_after)
+
+    with get_connection() as conn:
+        allowed, retry_after, _ = rate_limiter.check_shared(conn, action, user_id=body.get('email'), ip=ip)
+    if not allowed:
+        return too_many_requests(retry_after)
+
+    return dispatch(ROUTES, action, body)
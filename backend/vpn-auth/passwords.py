@@ -0,0 +1,146 @@
+import os
+import hmac
+import time
+import base64
+import hashlib
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from tracing import span
+
+PASSWORD_SCHEME = os.environ.get('PASSWORD_SCHEME', 'scrypt')
+SCRYPT_N = int(os.environ.get('PASSWORD_SCRYPT_N', str(2 ** 14)))
+SCRYPT_R = int(os.environ.get('PASSWORD_SCRYPT_R', '8'))
+SCRYPT_P = int(os.environ.get('PASSWORD_SCRYPT_P', '1'))
+PBKDF2_ITERATIONS = int(os.environ.get('PASSWORD_PBKDF2_ITERATIONS', '600000'))
+HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', str(os.cpu_count() or 2)))
+HASH_QUEUE_LIMIT = int(os.environ.get('PASSWORD_HASH_QUEUE_LIMIT', str(HASH_WORKERS * 4)))
+HASH_ADMISSION_TIMEOUT = float(os.environ.get('PASSWORD_HASH_ADMISSION_TIMEOUT', '0.5'))
+
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+
+class HashingOverloaded(Exception):
+    pass
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode()
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                          maxmem=256 * n * r, dklen=KEY_BYTES)
+
+
+def _pbkdf2(password: str, salt: bytes, iterations: int) -> bytes:
+    return hashlib.pbkdf2_hmac('sha256', password.encode(), salt, iterations, dklen=KEY_BYTES)
+
+
+def hash_password_sync(password: str, scheme: str = PASSWORD_SCHEME) -> str:
+    salt = secrets.token_bytes(SALT_BYTES)
+    if scheme == 'pbkdf2_sha256':
+        key = _pbkdf2(password, salt, PBKDF2_ITERATIONS)
+        return f'pbkdf2_sha256${PBKDF2_ITERATIONS}${_b64(salt)}${_b64(key)}'
+    key = _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return f'scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64(salt)}${_b64(key)}'
+
+
+def verify_password_sync(password: str, stored: str) -> tuple:
+    '''Проверяет пароль; возвращает (совпал, нужно ли перехешировать с текущими параметрами)'''
+    parts = stored.split('$')
+
+    if parts[0] == 'scrypt' and len(parts) == 6:
+        n, r, p = int(parts[1]), int(parts[2]), int(parts[3])
+        key = _scrypt(password, base64.b64decode(parts[4]), n, r, p)
+        matched = hmac.compare_digest(key, base64.b64decode(parts[5]))
+        stale = PASSWORD_SCHEME != 'scrypt' or (n, r, p) != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+        return matched, matched and stale
+
+    if parts[0] == 'pbkdf2_sha256' and len(parts) == 4:
+        iterations = int(parts[1])
+        key = _pbkdf2(password, base64.b64decode(parts[2]), iterations)
+        matched = hmac.compare_digest(key, base64.b64decode(parts[3]))
+        stale = PASSWORD_SCHEME != 'pbkdf2_sha256' or iterations != PBKDF2_ITERATIONS
+        return matched, matched and stale
+
+    legacy = hashlib.sha256(password.encode()).hexdigest()
+    matched = hmac.compare_digest(legacy, stored)
+    return matched, matched
+
+
+_executor = None
+_executor_lock = threading.Lock()
+_admission = threading.BoundedSemaphore(HASH_QUEUE_LIMIT)
+_dummy_hash = []
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix='password-hash')
+    return _executor
+
+
+def _submit(fn, *args):
+    if not _admission.acquire(timeout=HASH_ADMISSION_TIMEOUT):
+        raise HashingOverloaded('Сервис авторизации перегружен, повторите попытку позже')
+    try:
+        with span('hash'):
+            return _get_executor().submit(fn, *args).result()
+    finally:
+        _admission.release()
+
+
+def hash_password(password: str) -> str:
+    '''Хеширует пароль в ограниченном пуле потоков'''
+    return _submit(hash_password_sync, password)
+
+
+def verify_password(password: str, stored) -> tuple:
+    '''Проверяет пароль в ограниченном пуле; для неизвестного пользователя тратит столько же времени'''
+    if stored is None:
+        if not _dummy_hash:
+            _dummy_hash.append(hash_password_sync(secrets.token_hex(8)))
+        _submit(verify_password_sync, password, _dummy_hash[0])
+        return False, False
+    return _submit(verify_password_sync, password, stored)
+
+
+def benchmark(seconds: float = 2.0) -> list:
+    '''Замеряет хеши в секунду на одно ядро для набора параметров стоимости'''
+    settings = [('scrypt', n, 8, 1) for n in (2 ** 13, 2 ** 14, 2 ** 15, 2 ** 16)]
+    settings += [('pbkdf2_sha256', iterations) for iterations in (210000, 600000, 1000000)]
+
+    results = []
+    salt = secrets.token_bytes(SALT_BYTES)
+    for setting in settings:
+        count = 0
+        started = time.perf_counter()
+        while time.perf_counter() - started < seconds:
+            if setting[0] == 'scrypt':
+                _scrypt('benchmark-password', salt, *setting[1:])
+            else:
+                _pbkdf2('benchmark-password', salt, setting[1])
+            count += 1
+        elapsed = time.perf_counter() - started
+        results.append({
+            'scheme': setting[0],
+            'params': list(setting[1:]),
+            'hashesPerSecondPerCore': round(count / elapsed, 2),
+            'msPerHash': round(elapsed * 1000 / count, 2)
+        })
+    return results
+
+
+if __name__ == '__main__':
+    import json
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Бенчмарк стоимости хеширования паролей')
+    parser.add_argument('--seconds', type=float, default=2.0)
+    args = parser.parse_args()
+    print(json.dumps(benchmark(args.seconds), indent=2))
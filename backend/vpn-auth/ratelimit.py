@@ -0,0 +1,184 @@
+import os
+import json
+import math
+import time
+import hashlib
+import threading
+from psycopg2.extras import execute_values
+from runtime import error
+
+SCHEMA = 't_p58863800_vpn_setup_project'
+RATE_LIMIT_SHARED = os.environ.get('RATE_LIMIT_SHARED', '1') == '1'
+RATE_LIMIT_SYNC_FRACTION = float(os.environ.get('RATE_LIMIT_SYNC_FRACTION', '0.5'))
+LOCAL_BUCKETS_MAX = 10000
+BUCKET_PURGE_BATCH_SIZE = int(os.environ.get('RATE_LIMIT_PURGE_BATCH_SIZE', '1000'))
+
+DEFAULT_LIMITS = {
+    'register': {'ip': [5, 5 / 3600]},
+    'login': {'ip': [20, 20 / 60], 'user': [10, 10 / 60]},
+    'connect': {'ip': [30, 30 / 60], 'user': [10, 10 / 60]},
+    'disconnect': {'ip': [30, 30 / 60], 'user': [20, 20 / 60]},
+    'config': {'user': [30, 30 / 60]},
+    'logs': {'user': [60, 1.0]}
+}
+
+RATE_LIMITS = json.loads(os.environ['RATE_LIMITS_JSON']) if os.environ.get('RATE_LIMITS_JSON') else DEFAULT_LIMITS
+
+SHARED_BUCKETS_SQL = f'''
+    INSERT INTO {SCHEMA}.rate_limit_buckets AS b (bucket_key, tokens, capacity, rate, updated_at)
+    VALUES %s
+    ON CONFLICT (bucket_key) DO UPDATE SET
+        tokens = GREATEST(
+            LEAST(
+                EXCLUDED.capacity,
+                b.tokens + EXTRACT(EPOCH FROM clock_timestamp() - b.updated_at) * EXCLUDED.rate
+            ) - (EXCLUDED.capacity - EXCLUDED.tokens),
+            -1
+        ),
+        capacity = EXCLUDED.capacity,
+        rate = EXCLUDED.rate,
+        updated_at = clock_timestamp()
+    RETURNING bucket_key, tokens
+'''
+
+PURGE_FULL_BUCKETS_SQL = f'''
+    DELETE FROM {SCHEMA}.rate_limit_buckets
+    WHERE bucket_key IN (
+        SELECT bucket_key FROM {SCHEMA}.rate_limit_buckets
+        WHERE updated_at < clock_timestamp() - make_interval(secs => (capacity - tokens) / NULLIF(rate, 0))
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+    )
+'''
+
+
+def _key_digest(value) -> str:
+    '''Фиксированная длина ключа бакета при любом присланном клиентом значении'''
+    return hashlib.blake2b(str(value).encode(), digest_size=16).hexdigest()
+
+
+class RateLimiter:
+    '''Token bucket по ключам действие/класс/значение: локальный быстрый путь и общий бакет в Postgres.
+
+    Общий бакет опрашивается, только когда локальный опустился ниже доли sync_fraction от ёмкости;
+    тогда в него разом списываются все запросы, пропущенные локально с прошлой сверки.
+    '''
+
+    def __init__(self, limits: dict = RATE_LIMITS, shared: bool = RATE_LIMIT_SHARED,
+                 sync_fraction: float = RATE_LIMIT_SYNC_FRACTION):
+        self.limits = limits
+        self.shared = shared
+        self.sync_fraction = sync_fraction
+        self._buckets = {}
+        self._unsynced = {}
+        self._lock = threading.Lock()
+        self.stats = {'allowed': 0, 'denied': {}, 'shared_checks': 0}
+
+    def _keys(self, action: str, user_id=None, ip=None) -> list:
+        values = {'user': user_id, 'ip': ip}
+        return [
+            (key_class, f'{action}:{key_class}:{_key_digest(values[key_class])}', float(capacity), float(rate))
+            for key_class, (capacity, rate) in self.limits.get(action, {}).items()
+            if values.get(key_class) is not None
+        ]
+
+    def _deny(self, key_class: str, retry_after: float) -> tuple:
+        with self._lock:
+            self.stats['denied'][key_class] = self.stats['denied'].get(key_class, 0) + 1
+        return False, max(1, math.ceil(retry_after)), key_class
+
+    def check_local(self, action: str, user_id=None, ip=None) -> tuple:
+        '''Проверяет бакеты процесса; возвращает (разрешено, Retry-After в секундах, класс ключа)'''
+        now = time.monotonic()
+        with self._lock:
+            if len(self._buckets) > LOCAL_BUCKETS_MAX:
+                self._buckets.clear()
+                self._unsynced.clear()
+            for key_class, key, capacity, rate in self._keys(action, user_id, ip):
+                tokens, updated_at = self._buckets.get(key, (capacity, now))
+                tokens = min(capacity, tokens + (now - updated_at) * rate)
+                if tokens < 1:
+                    self._buckets[key] = (tokens, now)
+                    retry_after = (1 - tokens) / rate
+                    break
+                self._buckets[key] = (tokens - 1, now)
+                self._unsynced[key] = self._unsynced.get(key, 0) + 1
+            else:
+                self.stats['allowed'] += 1
+                return True, 0, None
+        return self._deny(key_class, retry_after)
+
+    def _sync_due(self, keys: list) -> bool:
+        return any(
+            key not in self._buckets or self._buckets[key][0] < capacity * self.sync_fraction
+            for _, key, capacity, _ in keys
+        )
+
+    def check_shared(self, conn, action: str, user_id=None, ip=None) -> tuple:
+        '''Сверяет общие бакеты, когда локальные на исходе: одно списание на все несверенные запросы и commit'''
+        keys = self._keys(action, user_id, ip)
+        if not self.shared or not keys:
+            return True, 0, None
+
+        with self._lock:
+            if not self._sync_due(keys):
+                return True, 0, None
+            costs = {key: max(self._unsynced.pop(key, 0), 1) for _, key, _, _ in keys}
+
+        with conn.cursor() as cursor:
+            rows = execute_values(
+                cursor, SHARED_BUCKETS_SQL,
+                [(key, capacity - costs[key], capacity, rate)
+                 for _, key, capacity, rate in sorted(keys, key=lambda k: k[1])],
+                template='(%s, %s, %s, %s, clock_timestamp())',
+                fetch=True
+            )
+            tokens_by_key = dict(rows)
+        conn.commit()
+
+        now = time.monotonic()
+        with self._lock:
+            self.stats['shared_checks'] += 1
+            for _, key, capacity, _ in keys:
+                local_tokens = self._buckets.get(key, (capacity, now))[0]
+                self._buckets[key] = (min(local_tokens, tokens_by_key.get(key, 0)), now)
+        for key_class, key, capacity, rate in keys:
+            tokens = tokens_by_key.get(key, 0)
+            if tokens < 0:
+                return self._deny(key_class, (1 - tokens) / rate)
+        return True, 0, None
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.stats, denied=dict(self.stats['denied']), local_buckets=len(self._buckets))
+
+
+rate_limiter = RateLimiter()
+
+
+def purge_full_buckets(conn, batch_size: int = BUCKET_PURGE_BATCH_SIZE, max_batches: int = 100) -> int:
+    '''Удаляет пачками общие бакеты, которые успели заполниться заново: они не отличаются от отсутствующих'''
+    purged = 0
+    with conn.cursor() as cursor:
+        for _ in range(max_batches):
+            cursor.execute(PURGE_FULL_BUCKETS_SQL, (batch_size,))
+            deleted = cursor.rowcount
+            conn.commit()
+            purged += deleted
+            if deleted < batch_size:
+                break
+    return purged
+
+
+def client_ip(event: dict):
+    '''IP клиента из контекста запроса или X-Forwarded-For'''
+    identity = (event.get('requestContext') or {}).get('identity') or {}
+    if identity.get('sourceIp'):
+        return identity['sourceIp']
+    headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+    forwarded = headers.get('x-forwarded-for')
+    return forwarded.split(',')[0].strip() if forwarded else None
+
+
+def too_many_requests(retry_after: int) -> dict:
+    return error(429, 'Слишком много запросов, повторите попытку позже', {'Retry-After': str(retry_after)})
@@ -0,0 +1,81 @@
+import json
+import functools
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+CORS_HEADERS = {'Access-Control-Allow-Origin': '*'}
+JSON_HEADERS = {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
+
+
+def dumps(data) -> str:
+    '''Сериализует JSON через orjson, если он установлен, иначе стандартным json'''
+    if orjson is not None:
+        return orjson.dumps(data).decode()
+    return json.dumps(data)
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def respond(status: int, data=None, headers: dict = None) -> dict:
+    '''Ответ функции; заголовки по умолчанию — общий неизменяемый словарь JSON_HEADERS'''
+    return {
+        'statusCode': status,
+        'headers': {**JSON_HEADERS, **headers} if headers else JSON_HEADERS,
+        'body': '' if data is None else dumps(data),
+        'isBase64Encoded': False
+    }
+
+
+def error(status: int, message: str, headers: dict = None) -> dict:
+    return respond(status, {'error': message}, headers)
+
+
+def preflight(methods: str, allow_headers: str = 'Content-Type, Authorization, X-Auth-Token') -> dict:
+    '''Заранее собранный ответ на OPTIONS'''
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Methods': methods,
+            'Access-Control-Allow-Headers': allow_headers
+        },
+        'body': '',
+        'isBase64Encoded': False
+    }
+
+
+METHOD_NOT_ALLOWED = error(405, 'Method not allowed')
+UNAUTHORIZED = error(401, 'Требуется авторизация')
+
+
+def dispatch(routes: dict, key, *args, default=None) -> dict:
+    '''Вызывает обработчик маршрута из таблицы; неизвестный ключ уходит в default или получает 405'''
+    route = routes.get(key, default)
+    if route is None:
+        return METHOD_NOT_ALLOWED
+    return route(*args)
+
+
+def guarded(known: dict = None):
+    '''Декоратор handler: известные исключения превращает в ответы по таблице, остальные — в 500'''
+    known = known or {}
+
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(event: dict, context) -> dict:
+            try:
+                return handler(event, context)
+            except Exception as e:
+                for exc_class, build in known.items():
+                    if isinstance(e, exc_class):
+                        return build(e)
+                return error(500, str(e))
+        return wrapper
+    return decorator
@@ -0,0 +1,118 @@
+import os
+import zlib
+import hashlib
+from ovpn_template import assemble_config
+
+SCHEMA = 't_p58863800_vpn_setup_project'
+STORAGE_MODE = os.environ.get('CONFIG_STORAGE_MODE', 'compact')
+PURGE_BATCH_SIZE = int(os.environ.get('CONFIG_PURGE_BATCH_SIZE', '500'))
+
+_SEPARATOR = b'\0'
+_known_templates = set()
+
+
+def pack_parts(parts: tuple) -> bytes:
+    return zlib.compress(_SEPARATOR.join(parts))
+
+
+def unpack_parts(packed: bytes) -> tuple:
+    return tuple(zlib.decompress(bytes(packed)).split(_SEPARATOR))
+
+
+def template_hash(static: tuple) -> str:
+    return hashlib.sha256(_SEPARATOR.join(static)).hexdigest()
+
+
+def prepare_template(static: tuple) -> tuple:
+    '''Возвращает хеш шаблона и сжатое тело, если шаблон ещё не записан в базу'''
+    content_hash = template_hash(static)
+    if content_hash in _known_templates:
+        return content_hash, None
+    return content_hash, pack_parts(static)
+
+
+def ensure_template(cursor, static: tuple) -> str:
+    content_hash, template_body = prepare_template(static)
+    if template_body is not None:
+        cursor.execute(f'''
+            INSERT INTO {SCHEMA}.config_templates (content_hash, template_body)
+            VALUES (%s, %s)
+            ON CONFLICT (content_hash) DO NOTHING
+        ''', (content_hash, template_body))
+    return content_hash
+
+
+def templates_committed(*content_hashes) -> None:
+    '''Запоминает шаблоны, записанные вызывающим в уже зафиксированной им транзакции'''
+    _known_templates.update(content_hash for content_hash in content_hashes if content_hash)
+
+
+def save_config(cursor, user_id, server_id, protocol: str, encryption: str,
+                static: tuple, dynamic: tuple, expires_at) -> int:
+    '''Сохраняет конфигурацию: общий шаблон один раз по хешу, в строке — только сжатые вставки без имени пользователя'''
+    if STORAGE_MODE == 'plain':
+        cursor.execute(f'''
+            INSERT INTO {SCHEMA}.vpn_configs
+            (user_id, server_id, config_type, encryption, config_content, expires_at)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            RETURNING id
+        ''', (user_id, server_id, protocol, encryption,
+              assemble_config(static, dynamic).decode(), expires_at))
+        return cursor.fetchone()['id']
+
+    content_hash = ensure_template(cursor, static)
+    cursor.execute(f'''
+        INSERT INTO {SCHEMA}.vpn_configs
+        (user_id, server_id, config_type, encryption, template_hash, config_delta, expires_at)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        RETURNING id
+    ''', (user_id, server_id, protocol, encryption, content_hash,
+          pack_parts(dynamic[1:]), expires_at))
+    return cursor.fetchone()['id']
+
+
+def load_config(cursor, config_id, user_id):
+    '''Читает конфигурацию пользователя, восстанавливая её из шаблона и вставок'''
+    cursor.execute(f'''
+        SELECT c.id, c.config_type, c.config_content, c.config_delta,
+               c.expires_at, t.template_body, u.username
+        FROM {SCHEMA}.vpn_configs c
+        JOIN {SCHEMA}.users u ON u.id = c.user_id
+        LEFT JOIN {SCHEMA}.config_templates t ON t.content_hash = c.template_hash
+        WHERE c.id = %s AND c.user_id = %s
+          AND (c.expires_at IS NULL OR c.expires_at > CURRENT_TIMESTAMP)
+    ''', (config_id, user_id))
+
+    row = cursor.fetchone()
+    if not row:
+        return None
+
+    if row['config_content'] is not None:
+        return row['config_content']
+
+    return assemble_config(
+        unpack_parts(row['template_body']),
+        (row['username'].encode(),) + unpack_parts(row['config_delta'])
+    ).decode()
+
+
+def purge_expired_configs(conn, batch_size: int = PURGE_BATCH_SIZE, max_batches: int = 100) -> int:
+    '''Удаляет просроченные конфигурации пачками, фиксируя каждую пачку отдельно'''
+    purged = 0
+    with conn.cursor() as cursor:
+        for _ in range(max_batches):
+            cursor.execute(f'''
+                DELETE FROM {SCHEMA}.vpn_configs
+                WHERE id IN (
+                    SELECT id FROM {SCHEMA}.vpn_configs
+                    WHERE expires_at < CURRENT_TIMESTAMP
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+            ''', (batch_size,))
+            deleted = cursor.rowcount
+            conn.commit()
+            purged += deleted
+            if deleted < batch_size:
+                break
+    return purged
@@ -0,0 +1,116 @@
+import os
+import time
+import random
+import threading
+import ipaddress
+from array import array
+from config_store import SCHEMA
+
+VPN_SUBNET = os.environ.get('VPN_SUBNET', '10.8.0.0/16')
+POOL_RESYNC_SECONDS = float(os.environ.get('VPN_IP_POOL_RESYNC', '300'))
+
+
+class AddressPoolExhausted(Exception):
+    pass
+
+
+class AddressPool:
+    '''Пул адресов подсети: битовая карта занятых адресов и стек свободных для O(1) выдачи.
+
+    Выдача начинается со случайного смещения, чтобы контейнеры не претендовали на одни и те же адреса.
+    '''
+
+    def __init__(self, subnet: str = VPN_SUBNET):
+        network = ipaddress.ip_network(subnet)
+        self.base = int(network.network_address)
+        self.size = network.num_addresses
+        self._used = bytearray((self.size + 7) // 8)
+        self._lock = threading.Lock()
+        for reserved in (0, 1, self.size - 1):
+            self._set(reserved)
+        start = random.randint(2, self.size - 2)
+        self._free = array('I', range(start - 1, 1, -1))
+        self._free.extend(range(self.size - 2, start - 1, -1))
+        self.in_use = 0
+        self.synced_at = 0.0
+
+    def _is_set(self, index: int) -> bool:
+        return self._used[index >> 3] & (1 << (index & 7)) != 0
+
+    def _set(self, index: int) -> None:
+        self._used[index >> 3] |= 1 << (index & 7)
+
+    def _clear(self, index: int) -> None:
+        self._used[index >> 3] &= ~(1 << (index & 7)) & 0xFF
+
+    def _index(self, address: str):
+        try:
+            index = int(ipaddress.ip_address(address)) - self.base
+        except ValueError:
+            return None
+        return index if 1 < index < self.size - 1 else None
+
+    def allocate(self) -> str:
+        with self._lock:
+            while self._free:
+                index = self._free.pop()
+                if not self._is_set(index):
+                    self._set(index)
+                    self.in_use += 1
+                    return str(ipaddress.ip_address(self.base + index))
+        raise AddressPoolExhausted('Свободные VPN-адреса закончились')
+
+    def mark_used(self, address: str) -> None:
+        index = self._index(address)
+        if index is None:
+            return
+        with self._lock:
+            if not self._is_set(index):
+                self._set(index)
+                self.in_use += 1
+
+    def release(self, address: str) -> None:
+        index = self._index(address)
+        if index is None:
+            return
+        with self._lock:
+            if self._is_set(index):
+                self._clear(index)
+                self._free.append(index)
+                self.in_use -= 1
+
+    def stats(self) -> dict:
+        return {'size': self.size - 3, 'inUse': self.in_use, 'free': self.size - 3 - self.in_use}
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_address_pool(cursor, server_id: int, refresh: bool = False) -> AddressPool:
+    '''Возвращает пул сервера, заполняя его из активных подключений при создании, раз в VPN_IP_POOL_RESYNC
+    и по запросу, когда адрес оказался занят другим контейнером'''
+    pool = _pools.get(server_id)
+    if not refresh and pool is not None and time.monotonic() - pool.synced_at < POOL_RESYNC_SECONDS:
+        return pool
+
+    cursor.execute(f'''
+        SELECT vpn_ip FROM {SCHEMA}.vpn_connections
+        WHERE server_id = %s AND connection_status = 'connected'
+    ''', (server_id,))
+
+    pool = AddressPool()
+    for row in cursor.fetchall():
+        pool.mark_used(row['vpn_ip'])
+    pool.synced_at = time.monotonic()
+
+    with _pools_lock:
+        _pools[server_id] = pool
+    return pool
+
+
+def release_address(server_id: int, address: str) -> None:
+    '''Возвращает адрес в пул сервера, если пул уже создан в этом контейнере'''
+    pool = _pools.get(server_id)
+    if pool is not None and address:
+        pool.release(address)
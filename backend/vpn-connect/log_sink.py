@@ -0,0 +1,186 @@
+import os
+import time
+import atexit
+import threading
+from datetime import datetime
+import psycopg2
+from psycopg2.extras import execute_values
+from db import get_connection
+from config_store import SCHEMA
+
+LOG_BUFFER_ENABLED = os.environ.get('LOG_BUFFER_ENABLED', '1') == '1'
+LOG_BUFFER_BATCH_SIZE = int(os.environ.get('LOG_BUFFER_BATCH_SIZE', '200'))
+LOG_BUFFER_FLUSH_INTERVAL = float(os.environ.get('LOG_BUFFER_FLUSH_INTERVAL', '1'))
+LOG_BUFFER_MAX_SIZE = int(os.environ.get('LOG_BUFFER_MAX_SIZE', '10000'))
+
+INSERT_LOG_SQL = f'''
+    INSERT INTO {SCHEMA}.connection_logs
+    (user_id, connection_id, event_type, event_details)
+    VALUES (%s, %s, %s, %s)
+'''
+
+INSERT_TIMED_LOG_SQL = f'''
+    INSERT INTO {SCHEMA}.connection_logs
+    (user_id, connection_id, event_type, event_details, timestamp)
+    VALUES (%s, %s, %s, %s, %s)
+'''
+
+INSERT_LOGS_BATCH_SQL = f'''
+    INSERT INTO {SCHEMA}.connection_logs
+    (user_id, connection_id, event_type, event_details, timestamp)
+    VALUES %s
+'''
+
+
+class LogSink:
+    '''Буфер событий connection_logs: пишет пачками по размеру или по времени.
+
+    События попадают в буфер только после commit своей транзакции. Контейнер замораживается
+    между вызовами и может быть остановлен без atexit, поэтому события последних
+    LOG_BUFFER_FLUSH_INTERVAL секунд до простоя могут потеряться; LOG_BUFFER_ENABLED=0 пишет их в транзакции.
+    '''
+
+    def __init__(self, enabled: bool = LOG_BUFFER_ENABLED, batch_size: int = LOG_BUFFER_BATCH_SIZE,
+                 flush_interval: float = LOG_BUFFER_FLUSH_INTERVAL, max_size: int = LOG_BUFFER_MAX_SIZE):
+        self.enabled = enabled
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._oldest_at = None
+        self._wake = threading.Event()
+        self._worker = None
+        self.stats = {
+            'enqueued': 0,
+            'written': 0,
+            'flushes': 0,
+            'failures': 0,
+            'dropped': 0,
+            'rejected': 0,
+            'flush_ms_total': 0.0,
+            'flush_ms_max': 0.0
+        }
+
+    def write(self, cursor, user_id, connection_id, event_type: str, details: str):
+        '''При выключенном буфере пишет событие в текущей транзакции; иначе возвращает его для enqueue после commit'''
+        if not self.enabled:
+            cursor.execute(INSERT_LOG_SQL, (user_id, connection_id, event_type, details))
+            return None
+        return user_id, connection_id, event_type, details, datetime.now()
+
+    def enqueue(self, event) -> None:
+        '''Ставит в буфер событие уже зафиксированной транзакции и будит фоновый поток, когда пачка набрана'''
+        if event is None:
+            return
+
+        with self._lock:
+            self._buffer.append(event)
+            self.stats['enqueued'] += 1
+            if self._oldest_at is None:
+                self._oldest_at = time.monotonic()
+            full = len(self._buffer) >= self.batch_size
+
+        self._ensure_worker()
+        if full:
+            self._wake.set()
+
+    def wake_if_due(self) -> None:
+        '''Будит фоновый поток в начале вызова: пока контейнер заморожен, таймер потока не срабатывает'''
+        with self._lock:
+            due = self._oldest_at is not None and time.monotonic() - self._oldest_at >= self.flush_interval
+        if due:
+            self._ensure_worker()
+            self._wake.set()
+
+    def flush_if_due(self) -> None:
+        with self._lock:
+            due = self._oldest_at is not None and (
+                len(self._buffer) >= self.batch_size
+                or time.monotonic() - self._oldest_at >= self.flush_interval
+            )
+        if due:
+            self.flush()
+
+    def flush(self) -> int:
+        with self._flush_lock:
+            with self._lock:
+                batch, self._buffer = self._buffer, []
+                self._oldest_at = None
+            if not batch:
+                return 0
+
+            started = time.monotonic()
+            written = 0
+            done = 0
+            try:
+                with get_connection() as conn, conn.cursor() as cursor:
+                    try:
+                        execute_values(cursor, INSERT_LOGS_BATCH_SQL, batch, page_size=self.batch_size)
+                        conn.commit()
+                        written = done = len(batch)
+                    except (psycopg2.IntegrityError, psycopg2.DataError):
+                        conn.rollback()
+                        for event in batch:
+                            try:
+                                cursor.execute(INSERT_TIMED_LOG_SQL, event)
+                                conn.commit()
+                                written += 1
+                            except (psycopg2.IntegrityError, psycopg2.DataError):
+                                conn.rollback()
+                                self.stats['rejected'] += 1
+                            done += 1
+            except Exception:
+                self.stats['failures'] += 1
+                self.stats['written'] += written
+                self._requeue(batch[done:])
+                raise
+
+            elapsed_ms = (time.monotonic() - started) * 1000
+            self.stats['flushes'] += 1
+            self.stats['written'] += written
+            self.stats['flush_ms_total'] += elapsed_ms
+            self.stats['flush_ms_max'] = max(self.stats['flush_ms_max'], elapsed_ms)
+            return written
+
+    def _requeue(self, batch: list) -> None:
+        with self._lock:
+            self._buffer = batch + self._buffer
+            overflow = len(self._buffer) - self.max_size
+            if overflow > 0:
+                del self._buffer[:overflow]
+                self.stats['dropped'] += overflow
+            if self._buffer and self._oldest_at is None:
+                self._oldest_at = time.monotonic()
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name='log-sink', daemon=True)
+            self._worker.start()
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush_if_due()
+            except Exception:
+                pass
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.stats, queue_depth=len(self._buffer))
+
+
+log_sink = LogSink()
+
+
+def _flush_on_exit() -> None:
+    try:
+        log_sink.flush()
+    except Exception:
+        pass
+
+
+atexit.register(_flush_on_exit)
@@ -0,0 +1,161 @@
+import io
+import os
+import json
+import zipfile
+from datetime import datetime, timedelta
+from psycopg2.extras import execute_values
+from config_store import SCHEMA, STORAGE_MODE, pack_parts, templates_committed, ensure_template
+from ovpn_template import SUPPORTED_CIPHERS, assemble_config, compile_openvpn_template, new_key_material
+from sessions import get_server
+
+PROVISION_MAX_SEATS = int(os.environ.get('PROVISION_MAX_SEATS', '5000'))
+DISABLED_PASSWORD = '!'
+
+
+def parse_seats(seats) -> list:
+    '''Проверяет список мест и убирает повторы email; бросает ValueError на некорректных данных'''
+    if not isinstance(seats, list) or not seats or len(seats) > PROVISION_MAX_SEATS:
+        raise ValueError(f'seats должен быть непустым списком не длиннее {PROVISION_MAX_SEATS}')
+
+    parsed = {}
+    for seat in seats:
+        email = seat.get('email') if isinstance(seat, dict) else None
+        if not isinstance(email, str) or '@' not in email:
+            raise ValueError('Каждое место должно содержать email')
+        username = seat.get('username') or email.split('@')[0]
+        parsed.setdefault(email.lower(), (email, username))
+    return list(parsed.values())
+
+
+def _create_users(cursor, seats: list, subscription_tier: str, adopt_existing: bool) -> tuple:
+    '''Создаёт пользователей одним многострочным INSERT; возвращает созданных и email, уже занятые до вызова.
+
+    Существующие активные пользователи попадают в выдачу только при adopt_existing.
+    '''
+    created = execute_values(cursor, f'''
+        INSERT INTO {SCHEMA}.users (email, password_hash, username, subscription_tier)
+        VALUES %s
+        ON CONFLICT DO NOTHING
+        RETURNING id, email, username
+    ''', [(email, DISABLED_PASSWORD, username, subscription_tier) for email, username in seats],
+        page_size=len(seats), fetch=True)
+    users = {row['email']: row for row in created}
+
+    missing = [email for email, _ in seats if email not in users]
+    existing = set()
+    if missing:
+        cursor.execute(f'''
+            SELECT id, email, username, is_active
+            FROM {SCHEMA}.users
+            WHERE email = ANY(%s)
+        ''', (missing,))
+        for row in cursor.fetchall():
+            existing.add(row['email'])
+            if adopt_existing and row['is_active']:
+                users[row['email']] = row
+    return users, existing
+
+
+def render_configs(static: tuple, usernames: list) -> list:
+    '''Генерирует ключевой материал и собирает конфигурации; работа держит GIL, поэтому без пула потоков'''
+    rendered = []
+    for username in usernames:
+        material = new_key_material()
+        dynamic = (username.encode(),) + material
+        rendered.append((pack_parts(material), assemble_config(static, dynamic)))
+    return rendered
+
+
+def provision_seats(conn, cursor, seats, server_id, protocol: str, encryption: str,
+                    subscription_tier: str = 'premium', adopt_existing: bool = False) -> dict:
+    '''Создаёт пользователей и их конфигурации пачкой: два многострочных INSERT на весь запрос.
+
+    Возвращает None, если сервер не найден. Места без пароля: учётные данные — выданные конфигурации.
+    Уже зарегистрированные email возвращаются в existing и без adopt_existing конфигураций не получают.
+    '''
+    if protocol == 'WireGuard':
+        raise ValueError('Пакетная выдача пока поддерживает только OpenVPN')
+    if encryption not in SUPPORTED_CIPHERS:
+        raise ValueError('Неподдерживаемый шифр')
+
+    seats = parse_seats(seats)
+    server = get_server(cursor, server_id)
+    if not server:
+        return None
+
+    users, existing = _create_users(cursor, seats, subscription_tier, adopt_existing)
+    provisioned = [users[email] for email, _ in seats if email in users]
+    failed = [email for email, _ in seats if email not in users and email not in existing]
+    existing = [email for email, _ in seats if email in existing and email not in users]
+
+    static = compile_openvpn_template(server['ip_address'], server['port'], encryption)
+    rendered = render_configs(static, [user['username'] for user in provisioned])
+    expires_at = datetime.now() + timedelta(days=30)
+
+    content_hash = None
+    if STORAGE_MODE == 'plain':
+        rows = [
+            (user['id'], server['id'], protocol, encryption, None, None, config.decode(), expires_at)
+            for user, (_, config) in zip(provisioned, rendered)
+        ]
+    else:
+        content_hash = ensure_template(cursor, static)
+        rows = [
+            (user['id'], server['id'], protocol, encryption, content_hash, delta, None, expires_at)
+            for user, (delta, _) in zip(provisioned, rendered)
+        ]
+
+    config_ids = {}
+    if rows:
+        inserted = execute_values(cursor, f'''
+            INSERT INTO {SCHEMA}.vpn_configs
+            (user_id, server_id, config_type, encryption, template_hash, config_delta, config_content, expires_at)
+            VALUES %s
+            RETURNING id, user_id
+        ''', rows, page_size=len(rows), fetch=True)
+        config_ids = {row['user_id']: row['id'] for row in inserted}
+
+    conn.commit()
+    templates_committed(content_hash)
+
+    return {
+        'server': server,
+        'seats': [
+            {
+                'userId': user['id'],
+                'email': user['email'],
+                'username': user['username'],
+                'configId': config_ids.get(user['id']),
+                'config': config
+            }
+            for user, (_, config) in zip(provisioned, rendered)
+        ],
+        'existing': existing,
+        'failed': failed
+    }
+
+
+def to_ndjson(result: dict) -> str:
+    lines = [
+        json.dumps(dict(seat, config=seat['config'].decode()), ensure_ascii=False)
+        for seat in result['seats']
+    ]
+    lines += [json.dumps({'email': email, 'error': 'email уже зарегистрирован'}, ensure_ascii=False)
+              for email in result['existing']]
+    lines += [json.dumps({'email': email, 'error': 'имя пользователя уже занято'}, ensure_ascii=False)
+              for email in result['failed']]
+    return '\n'.join(lines) + '\n'
+
+
+def to_zip(result: dict) -> bytes:
+    '''Архив с конфигурацией на каждое место и manifest.json'''
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for seat in result['seats']:
+            archive.writestr(f'{seat["username"]}.ovpn', seat['config'])
+        archive.writestr('manifest.json', json.dumps({
+            'seats': [{k: v for k, v in seat.items() if k != 'config'} for seat in result['seats']],
+            'existing': result['existing'],
+            'failed': result['failed']
+        }, ensure_ascii=False, indent=2))
+    return buffer.getvalue()
@@ -0,0 +1,101 @@
+import os
+import time
+import heapq
+import random
+import threading
+from psycopg2.extras import RealDictCursor
+from db import get_connection
+
+SCHEMA = 't_p58863800_vpn_setup_project'
+RECOMMEND_CACHE_TTL = float(os.environ.get('RECOMMEND_CACHE_TTL', '5'))
+LATENCY_WEIGHT = float(os.environ.get('RECOMMEND_LATENCY_WEIGHT', '0.4'))
+HEADROOM_WEIGHT = float(os.environ.get('RECOMMEND_HEADROOM_WEIGHT', '0.6'))
+AUTO_PICK_TOP_K = int(os.environ.get('RECOMMEND_AUTO_TOP_K', '5'))
+MAX_RECOMMENDATIONS = 20
+
+_ranking = {'servers': [], 'computed_at': 0.0, 'picks': {}}
+_ranking_lock = threading.Lock()
+
+
+def _load_fleet(cursor) -> list:
+    cursor.execute(f'''
+        SELECT
+            s.id, s.server_name, s.country, s.city, s.flag_emoji,
+            s.ip_address, s.port, s.protocol, s.max_connections,
+            s.current_load, s.ping_ms,
+            COALESCE(st.active_connections, 0) AS active_connections
+        FROM {SCHEMA}.vpn_servers s
+        LEFT JOIN {SCHEMA}.server_live_totals st ON st.server_id = s.id
+        WHERE s.is_active = true
+    ''')
+    return cursor.fetchall()
+
+
+def score_fleet(fleet: list) -> list:
+    '''Оценивает весь парк серверов одним проходом по столбцам: задержка и запас по нагрузке'''
+    if not fleet:
+        return []
+
+    pings = [max(s['ping_ms'] or 1, 1) for s in fleet]
+    static_loads = [float(s['current_load'] or 0) / 100 for s in fleet]
+    live_loads = [s['active_connections'] / max(s['max_connections'] or 1, 1) for s in fleet]
+
+    best_ping = min(pings)
+    latency_scores = [best_ping / ping for ping in pings]
+    headrooms = [1 - max(static, live) for static, live in zip(static_loads, live_loads)]
+
+    scored = []
+    for server, latency, headroom, live in zip(fleet, latency_scores, headrooms, live_loads):
+        if headroom <= 0:
+            continue
+        scored.append(dict(
+            server,
+            live_load=live,
+            score=round(LATENCY_WEIGHT * latency + HEADROOM_WEIGHT * headroom, 4)
+        ))
+    return scored
+
+
+def _refresh_ranking(cursor) -> None:
+    if time.monotonic() - _ranking['computed_at'] < RECOMMEND_CACHE_TTL:
+        return
+    if cursor is None:
+        with get_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as own_cursor:
+            fleet = _load_fleet(own_cursor)
+    else:
+        fleet = _load_fleet(cursor)
+    scored = score_fleet(fleet)
+    _ranking['servers'] = heapq.nlargest(MAX_RECOMMENDATIONS, scored, key=lambda s: s['score'])
+    _ranking['picks'] = {}
+    _ranking['computed_at'] = time.monotonic()
+
+
+def recommend_servers(k: int = 3, cursor=None) -> list:
+    '''Возвращает k лучших серверов; оценка пересчитывается не чаще раза в RECOMMEND_CACHE_TTL'''
+    k = max(1, min(int(k), MAX_RECOMMENDATIONS))
+
+    with _ranking_lock:
+        _refresh_ranking(cursor)
+        return _ranking['servers'][:k]
+
+
+def pick_server(cursor=None, k: int = AUTO_PICK_TOP_K):
+    '''Выбирает сервер для serverId=auto: случайно среди k лучших с весом по оценке.
+
+    Каждый выбор до следующего пересчёта снижает вес сервера на одно подключение,
+    чтобы поток автоподключений не ложился на один узел.
+    '''
+    with _ranking_lock:
+        _refresh_ranking(cursor)
+        candidates = _ranking['servers'][:max(1, k)]
+        if not candidates:
+            return None
+
+        picks = _ranking['picks']
+        weights = [
+            max(s['score'] - HEADROOM_WEIGHT * picks.get(s['id'], 0) / max(s['max_connections'] or 1, 1), 0.0001)
+            for s in candidates
+        ]
+        server = random.choices(candidates, weights=weights)[0]
+        picks[server['id']] = picks.get(server['id'], 0) + 1
+        return server
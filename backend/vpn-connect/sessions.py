@@ -0,0 +1,206 @@
+import os
+import time
+from psycopg2 import errors
+from config_store import SCHEMA, pack_parts, prepare_template
+from ip_pool import AddressPoolExhausted, get_address_pool
+from log_sink import log_sink
+from ovpn_template import compile_openvpn_template, new_key_material
+from wireguard import WG_SERVER_PUBLIC_KEY, key_pool, render_wireguard_config, check_wireguard_server
+
+SERVER_CACHE_TTL = float(os.environ.get('SERVER_CACHE_TTL', '60'))
+OPEN_SESSION_ATTEMPTS = int(os.environ.get('OPEN_SESSION_ATTEMPTS', '5'))
+
+_servers = {}
+_servers_loaded_at = [0.0]
+
+_USER_LOOKUP = f'''
+        SELECT id, username
+        FROM {SCHEMA}.users
+        WHERE id = %(user_id)s'''
+
+_USER_FROM_CLAIMS = '''
+        SELECT CAST(%(user_id)s AS INTEGER) AS id, CAST(%(username)s AS VARCHAR) AS username'''
+
+_OPEN_SESSION_SQL = f'''
+    WITH srv AS (
+        SELECT id, server_name, ip_address, port, country, city
+        FROM {SCHEMA}.vpn_servers
+        WHERE id = %(server_id)s AND is_active = true
+    ), usr AS ({{usr}}
+    ), new_connection AS (
+        INSERT INTO {SCHEMA}.vpn_connections
+        (user_id, server_id, connection_status, vpn_ip)
+        SELECT usr.id, srv.id, 'connected', %(vpn_ip)s
+        FROM srv, usr
+        WHERE srv.ip_address = %(ip_address)s AND srv.port = %(port)s
+        ON CONFLICT (server_id, vpn_ip) WHERE connection_status = 'connected' DO NOTHING
+        RETURNING id, connected_at
+    ), new_log AS (
+        INSERT INTO {SCHEMA}.connection_logs
+        (user_id, connection_id, event_type, event_details)
+        SELECT %(user_id)s, id, 'Подключено', %(log_details)s
+        FROM new_connection
+        WHERE %(log_inline)s
+    ), new_template AS (
+        INSERT INTO {SCHEMA}.config_templates (content_hash, template_body)
+        SELECT %(template_hash)s, %(template_body)s
+        FROM new_connection
+        WHERE %(template_body)s IS NOT NULL
+        ON CONFLICT (content_hash) DO NOTHING
+    ), new_config AS (
+        INSERT INTO {SCHEMA}.vpn_configs
+        (user_id, server_id, config_type, encryption, template_hash, config_delta,
+         config_content, private_key, public_key, expires_at)
+        SELECT %(user_id)s, %(server_id)s, %(protocol)s, %(encryption)s,
+               %(template_hash)s, %(config_delta)s,
+               %(config_content)s, %(private_key)s, %(public_key)s, CURRENT_TIMESTAMP + INTERVAL '30 days'
+        FROM new_connection
+        WHERE %(config_delta)s IS NOT NULL OR %(config_content)s IS NOT NULL
+        RETURNING id
+    )
+    SELECT srv.server_name, srv.ip_address, srv.port, srv.country, srv.city,
+           usr.username, new_connection.id AS connection_id,
+           new_connection.connected_at, new_config.id AS config_id
+    FROM (SELECT 1) AS one
+    LEFT JOIN srv ON true
+    LEFT JOIN usr ON true
+    LEFT JOIN new_connection ON true
+    LEFT JOIN new_config ON true
+'''
+
+OPEN_SESSION_SQL = _OPEN_SESSION_SQL.replace('{usr}', _USER_LOOKUP)
+OPEN_SESSION_CLAIMS_SQL = _OPEN_SESSION_SQL.replace('{usr}', _USER_FROM_CLAIMS)
+
+
+def get_server(cursor, server_id, refresh: bool = False):
+    '''Возвращает активный сервер из кэша процесса, перечитывая весь список раз в SERVER_CACHE_TTL.
+
+    Если среди серверов есть WireGuard, запас ключей начинает заполняться в фоне.
+    '''
+    try:
+        server_id = int(server_id)
+    except (TypeError, ValueError):
+        return None
+
+    now = time.monotonic()
+    if refresh or now - _servers_loaded_at[0] > SERVER_CACHE_TTL or server_id not in _servers:
+        cursor.execute(f'''
+            SELECT id, server_name, ip_address, port, country, city, wg_public_key, wg_port
+            FROM {SCHEMA}.vpn_servers
+            WHERE is_active = true
+        ''')
+        _servers.clear()
+        _servers.update(
+            (row['id'], dict(row, wg_public_key=row['wg_public_key'] or WG_SERVER_PUBLIC_KEY))
+            for row in cursor.fetchall()
+        )
+        _servers_loaded_at[0] = now
+        if any(server['wg_public_key'] for server in _servers.values()):
+            key_pool.warm()
+
+    return _servers.get(server_id)
+
+
+def _execute_open_session(cursor, user_id, username, server: dict, protocol: str, encryption: str,
+                          compact: bool) -> dict:
+    if protocol == 'WireGuard':
+        check_wireguard_server(server)
+
+    address_pool = get_address_pool(cursor, server['id'])
+    vpn_ip = address_pool.allocate()
+
+    static, material, wg_config, private_key, public_key = None, None, None, None, None
+    template_hash, template_body, config_delta = None, None, None
+    if protocol == 'WireGuard':
+        private_key, public_key = key_pool.take()
+        wg_config = render_wireguard_config(private_key, vpn_ip, server)
+    else:
+        static = compile_openvpn_template(server['ip_address'], server['port'], encryption)
+        material = new_key_material()
+        if compact:
+            template_hash, template_body = prepare_template(static)
+            config_delta = pack_parts(material)
+
+    log_details = f'Защищенное соединение установлено ({encryption})'
+
+    try:
+        cursor.execute(OPEN_SESSION_SQL if username is None else OPEN_SESSION_CLAIMS_SQL, {
+            'server_id': server['id'],
+            'user_id': user_id,
+            'username': username,
+            'ip_address': server['ip_address'],
+            'port': server['port'],
+            'vpn_ip': vpn_ip,
+            'protocol': protocol,
+            'encryption': encryption,
+            'log_details': log_details,
+            'log_inline': not log_sink.enabled,
+            'template_hash': template_hash,
+            'template_body': template_body,
+            'config_delta': config_delta,
+            'config_content': wg_config,
+            'private_key': private_key,
+            'public_key': public_key
+        })
+        session = dict(cursor.fetchone(), vpn_ip=vpn_ip, static=static, material=material, wg_config=wg_config)
+    except errors.ForeignKeyViolation as e:
+        address_pool.release(vpn_ip)
+        if username is None or not (e.diag.constraint_name or '').endswith('user_id_fkey'):
+            raise
+        cursor.connection.rollback()
+        return {'server_name': server['server_name'], 'username': None, 'connection_id': None,
+                'address_taken': False, 'template_hash': None, 'log_event': None}
+    except Exception:
+        address_pool.release(vpn_ip)
+        raise
+
+    address_taken = (
+        not session['connection_id'] and session['username'] is not None
+        and (session['ip_address'], session['port']) == (server['ip_address'], server['port'])
+    )
+    session['log_event'] = None
+    if session['connection_id'] and log_sink.enabled:
+        session['log_event'] = log_sink.write(cursor, user_id, session['connection_id'], 'Подключено', log_details)
+    if not session['connection_id'] and not address_taken:
+        address_pool.release(vpn_ip)
+    session['address_taken'] = address_taken
+    session['template_hash'] = template_hash if session['connection_id'] else None
+    return session
+
+
+def open_session(cursor, user_id, server_id, protocol: str, encryption: str,
+                 compact: bool = True, username: str = None):
+    '''Одним запросом проверяет сервер и пользователя, создаёт подключение, лог и конфигурацию.
+
+    Если username известен из подписанного токена, пользователь в базе не ищется:
+    токен удалённого пользователя распознаётся по нарушению внешнего ключа.
+    Возвращает None, если сервер не найден; username = None, если не найден пользователь.
+    Если адрес занят другим контейнером, пул сервера один раз перечитывается из базы, и попытка повторяется.
+    Для WireGuard пара ключей берётся из заранее заполненного запаса.
+    Событие буфера логов возвращается в log_event: вызывающий ставит его в очередь после commit.
+    '''
+    server = get_server(cursor, server_id)
+    refreshed = False
+    resynced = False
+
+    for _ in range(OPEN_SESSION_ATTEMPTS):
+        if not server:
+            return None
+
+        session = _execute_open_session(cursor, user_id, username, server, protocol, encryption, compact)
+        if not session['server_name']:
+            return None
+        if session['connection_id'] or not session['username']:
+            return session
+        if session['address_taken']:
+            if not resynced:
+                get_address_pool(cursor, server['id'], refresh=True)
+                resynced = True
+            continue
+        if refreshed:
+            return None
+
+        server = get_server(cursor, server_id, refresh=True)
+        refreshed = True
+
+    raise AddressPoolExhausted('Не удалось выделить свободный VPN-адрес')
@@ -0,0 +1,79 @@
+import os
+import json
+import argparse
+from psycopg2.extras import RealDictCursor
+from db import get_connection
+from config_store import SCHEMA
+from ip_pool import release_address
+
+SESSION_STALE_AFTER_MINUTES = int(os.environ.get('SESSION_STALE_AFTER_MINUTES', '720'))
+SWEEP_BATCH_SIZE = int(os.environ.get('SWEEP_BATCH_SIZE', '500'))
+
+CLOSE_STALE_SQL = f'''
+    WITH stale AS (
+        SELECT id
+        FROM {SCHEMA}.vpn_connections
+        WHERE connection_status = 'connected'
+          AND COALESCE(last_seen_at, connected_at) < CURRENT_TIMESTAMP - %(stale_after)s * INTERVAL '1 minute'
+        ORDER BY COALESCE(last_seen_at, connected_at)
+        LIMIT %(batch_size)s
+        FOR UPDATE SKIP LOCKED
+    ), closed AS (
+        UPDATE {SCHEMA}.vpn_connections c
+        SET connection_status = 'disconnected',
+            disconnected_at = CURRENT_TIMESTAMP
+        FROM stale
+        WHERE c.id = stale.id AND c.connection_status = 'connected'
+        RETURNING c.id, c.user_id, c.server_id, c.vpn_ip
+    ), closed_logs AS (
+        INSERT INTO {SCHEMA}.connection_logs
+        (user_id, connection_id, event_type, event_details)
+        SELECT user_id, id, 'Отключение', 'Сессия закрыта по таймауту'
+        FROM closed
+    )
+    SELECT id, server_id, vpn_ip FROM closed
+'''
+
+RECOMPUTE_LOAD_SQL = f'''
+    UPDATE {SCHEMA}.vpn_servers s
+    SET current_load = live.load
+    FROM (
+        SELECT s2.id,
+               LEAST(100, ROUND(100.0 * COALESCE(st.active_connections, 0) / GREATEST(s2.max_connections, 1), 2)) AS load
+        FROM {SCHEMA}.vpn_servers s2
+        LEFT JOIN {SCHEMA}.server_live_totals st ON st.server_id = s2.id
+    ) live
+    WHERE s.id = live.id AND s.current_load IS DISTINCT FROM live.load
+'''
+
+
+def sweep_stale_sessions(conn, stale_after_minutes: int = SESSION_STALE_AFTER_MINUTES,
+                         batch_size: int = SWEEP_BATCH_SIZE, max_batches: int = 100) -> dict:
+    '''Закрывает зависшие сессии пачками и пересчитывает нагрузку серверов; безопасен при параллельном запуске'''
+    closed = 0
+    with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+        for _ in range(max_batches):
+            cursor.execute(CLOSE_STALE_SQL, {'stale_after': stale_after_minutes, 'batch_size': batch_size})
+            rows = cursor.fetchall()
+            conn.commit()
+
+            for row in rows:
+                release_address(row['server_id'], row['vpn_ip'])
+            closed += len(rows)
+            if len(rows) < batch_size:
+                break
+
+        cursor.execute(RECOMPUTE_LOAD_SQL)
+        servers_updated = cursor.rowcount
+        conn.commit()
+
+    return {'closedSessions': closed, 'serversUpdated': servers_updated}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Закрытие зависших VPN-сессий')
+    parser.add_argument('--stale-after', type=int, default=SESSION_STALE_AFTER_MINUTES)
+    parser.add_argument('--batch-size', type=int, default=SWEEP_BATCH_SIZE)
+    args = parser.parse_args()
+    with get_connection() as conn:
+        print(json.dumps(sweep_stale_sessions(conn, args.stale_after, args.batch_size)))
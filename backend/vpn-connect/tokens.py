@@ -0,0 +1,79 @@
+import os
+import hmac
+import json
+import time
+import base64
+import hashlib
+
+SESSION_TOKEN_TTL = int(os.environ.get('SESSION_TOKEN_TTL', str(7 * 24 * 3600)))
+
+_signer = {'secret': None, 'mac': None}
+
+
+class TokenConfigError(Exception):
+    pass
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+def _mac():
+    '''Возвращает подготовленный HMAC, переиспользуемый между тёплыми вызовами'''
+    secret = os.environ.get('SESSION_TOKEN_SECRET')
+    if not secret:
+        raise TokenConfigError('SESSION_TOKEN_SECRET is not set')
+    if _signer['secret'] != secret:
+        _signer['mac'] = hmac.new(secret.encode(), digestmod=hashlib.sha256)
+        _signer['secret'] = secret
+    return _signer['mac'].copy()
+
+
+def issue_token(user_id: int, username: str, subscription_tier: str, ttl: int = SESSION_TOKEN_TTL) -> str:
+    '''Выпускает подписанный токен с id, именем, тарифом пользователя и сроком действия'''
+    payload = _b64encode(json.dumps({
+        'uid': user_id,
+        'usr': username,
+        'tier': subscription_tier,
+        'exp': int(time.time()) + ttl
+    }, separators=(',', ':'), ensure_ascii=False).encode())
+    mac = _mac()
+    mac.update(payload.encode())
+    return f'{payload}.{_b64encode(mac.digest())}'
+
+
+def verify_token(token: str):
+    '''Проверяет подпись и срок действия токена без обращения к базе; возвращает claims или None'''
+    if not token or token.count('.') != 1:
+        return None
+    payload, signature = token.split('.')
+    mac = _mac()
+    mac.update(payload.encode())
+    try:
+        if not hmac.compare_digest(mac.digest(), _b64decode(signature)):
+            return None
+        claims = json.loads(_b64decode(payload))
+    except ValueError:
+        return None
+    if not isinstance(claims, dict) or claims.get('exp', 0) < time.time():
+        return None
+    return claims
+
+
+def token_from_event(event: dict):
+    '''Достаёт токен из заголовка X-Auth-Token или Authorization: Bearer'''
+    headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+    token = headers.get('x-auth-token')
+    if not token:
+        authorization = headers.get('authorization', '')
+        if authorization.lower().startswith('bearer '):
+            token = authorization[7:].strip()
+    return token
+
+
+def authenticate(event: dict):
+    return verify_token(token_from_event(event))
@@ -0,0 +1,79 @@
+import os
+from psycopg2.extras import execute_values
+from config_store import SCHEMA
+
+TRAFFIC_MAX_DELTAS = int(os.environ.get('TRAFFIC_MAX_DELTAS', '10000'))
+
+APPLY_DELTAS_SQL = f'''
+    WITH deltas (connection_id, bytes_sent, bytes_received) AS (
+        VALUES %s
+    ), updated AS (
+        UPDATE {SCHEMA}.vpn_connections c
+        SET bytes_sent = COALESCE(c.bytes_sent, 0) + d.bytes_sent,
+            bytes_received = COALESCE(c.bytes_received, 0) + d.bytes_received,
+            last_seen_at = CURRENT_TIMESTAMP
+        FROM deltas d
+        WHERE c.id = d.connection_id
+        RETURNING c.user_id, d.bytes_sent, d.bytes_received
+    ), per_user AS (
+        SELECT user_id, SUM(bytes_sent) AS bytes_sent, SUM(bytes_received) AS bytes_received
+        FROM updated
+        GROUP BY user_id
+    ), hourly AS (
+        INSERT INTO {SCHEMA}.traffic_rollups AS r
+        (user_id, granularity, bucket_start, bytes_sent, bytes_received)
+        SELECT user_id, 'hour', date_trunc('hour', CURRENT_TIMESTAMP), bytes_sent, bytes_received
+        FROM per_user
+        ORDER BY user_id
+        ON CONFLICT (user_id, granularity, bucket_start) DO UPDATE SET
+            bytes_sent = r.bytes_sent + EXCLUDED.bytes_sent,
+            bytes_received = r.bytes_received + EXCLUDED.bytes_received
+    ), daily AS (
+        INSERT INTO {SCHEMA}.traffic_rollups AS r
+        (user_id, granularity, bucket_start, bytes_sent, bytes_received)
+        SELECT user_id, 'day', date_trunc('day', CURRENT_TIMESTAMP), bytes_sent, bytes_received
+        FROM per_user
+        ORDER BY user_id
+        ON CONFLICT (user_id, granularity, bucket_start) DO UPDATE SET
+            bytes_sent = r.bytes_sent + EXCLUDED.bytes_sent,
+            bytes_received = r.bytes_received + EXCLUDED.bytes_received
+    )
+    SELECT COUNT(*) AS applied FROM updated
+'''
+
+
+def coalesce_deltas(deltas: list) -> list:
+    '''Суммирует дельты счётчиков по connectionId; бросает ValueError на некорректных данных'''
+    if not isinstance(deltas, list) or len(deltas) > TRAFFIC_MAX_DELTAS:
+        raise ValueError(f'deltas должен быть списком не длиннее {TRAFFIC_MAX_DELTAS}')
+
+    totals = {}
+    for delta in deltas:
+        try:
+            connection_id = int(delta['connectionId'])
+            sent = int(delta.get('bytesSent', 0))
+            received = int(delta.get('bytesReceived', 0))
+        except (KeyError, TypeError, ValueError, AttributeError):
+            raise ValueError('Каждая дельта должна содержать connectionId, bytesSent и bytesReceived')
+        if sent < 0 or received < 0:
+            raise ValueError('Счётчики трафика не могут уменьшаться')
+
+        current = totals.get(connection_id, (0, 0))
+        totals[connection_id] = (current[0] + sent, current[1] + received)
+
+    return sorted((connection_id, sent, received) for connection_id, (sent, received) in totals.items())
+
+
+def apply_traffic(cursor, deltas: list) -> dict:
+    '''Применяет пачку дельт одним UPDATE ... FROM (VALUES ...) и обновляет почасовые и суточные итоги'''
+    rows = coalesce_deltas(deltas)
+    if not rows:
+        return {'received': 0, 'applied': 0}
+
+    result = execute_values(
+        cursor, APPLY_DELTAS_SQL, rows,
+        template='(%s::INTEGER, %s::BIGINT, %s::BIGINT)',
+        page_size=len(rows),
+        fetch=True
+    )
+    return {'received': len(rows), 'applied': result[0]['applied']}
@@ -0,0 +1,177 @@
+import os
+import time
+import base64
+import secrets
+import threading
+from collections import deque
+
+try:
+    from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey
+    from cryptography.hazmat.primitives import serialization
+except ImportError:
+    X25519PrivateKey = None
+
+WG_KEY_POOL_SIZE = int(os.environ.get('WG_KEY_POOL_SIZE', '256'))
+WG_KEY_POOL_LOW_WATER = int(os.environ.get('WG_KEY_POOL_LOW_WATER', '64'))
+WG_KEY_POOL_WARM = os.environ.get('WG_KEY_POOL_WARM', '1') == '1'
+WG_SERVER_PUBLIC_KEY = os.environ.get('WG_SERVER_PUBLIC_KEY')
+WG_DNS = os.environ.get('WG_DNS', '1.1.1.1')
+WG_DEFAULT_PORT = 51820
+
+WIREGUARD_TEMPLATE = '''[Interface]
+PrivateKey = {private_key}
+Address = {address}/32
+DNS = {dns}
+
+[Peer]
+PublicKey = {server_public_key}
+Endpoint = {endpoint}
+AllowedIPs = 0.0.0.0/0, ::/0
+PersistentKeepalive = 25
+'''
+
+
+class WireGuardUnavailable(Exception):
+    pass
+
+
+_P = 2 ** 255 - 19
+_A24 = 121665
+
+
+def _x25519_base(scalar: bytes) -> bytes:
+    '''Умножение на базовую точку u=9 лестницей Монтгомери (RFC 7748), если нет библиотеки cryptography'''
+    k = bytearray(scalar)
+    k[0] &= 248
+    k[31] &= 127
+    k[31] |= 64
+    k = int.from_bytes(k, 'little')
+
+    x1, x2, z2, x3, z3 = 9, 1, 0, 9, 1
+    swap = 0
+    for t in range(254, -1, -1):
+        bit = (k >> t) & 1
+        swap ^= bit
+        if swap:
+            x2, x3, z2, z3 = x3, x2, z3, z2
+        swap = bit
+
+        a, b = x2 + z2, x2 - z2
+        aa, bb = a * a % _P, b * b % _P
+        e = aa - bb
+        c, d = x3 + z3, x3 - z3
+        da, cb = d * a % _P, c * b % _P
+        x3 = (da + cb) ** 2 % _P
+        z3 = x1 * (da - cb) ** 2 % _P
+        x2 = aa * bb % _P
+        z2 = e * (aa + _A24 * e) % _P
+
+    if swap:
+        x2, z2 = x3, z3
+    return (x2 * pow(z2, _P - 2, _P) % _P).to_bytes(32, 'little')
+
+
+def generate_keypair() -> tuple:
+    '''Новая пара ключей Curve25519 в base64, как у wg genkey / wg pubkey'''
+    if X25519PrivateKey is not None:
+        private = X25519PrivateKey.generate()
+        private_raw = private.private_bytes(serialization.Encoding.Raw, serialization.PrivateFormat.Raw,
+                                            serialization.NoEncryption())
+        public_raw = private.public_key().public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+    else:
+        private_raw = bytearray(secrets.token_bytes(32))
+        private_raw[0] &= 248
+        private_raw[31] = (private_raw[31] & 127) | 64
+        private_raw = bytes(private_raw)
+        public_raw = _x25519_base(private_raw)
+    return base64.b64encode(private_raw).decode(), base64.b64encode(public_raw).decode()
+
+
+class KeyPool:
+    '''Запас заранее сгенерированных пар ключей; фоновый поток доливает его при падении ниже low_water'''
+
+    def __init__(self, size: int = WG_KEY_POOL_SIZE, low_water: int = WG_KEY_POOL_LOW_WATER):
+        self.size = size
+        self.low_water = low_water
+        self._keys = deque()
+        self._lock = threading.Lock()
+        self._refilling = False
+        self.stats = {
+            'served': 0,
+            'misses': 0,
+            'generated': 0,
+            'refills': 0,
+            'refill_rate_per_second': 0.0
+        }
+
+    def _claim_refill(self) -> bool:
+        start_refill = len(self._keys) < self.low_water and not self._refilling
+        if start_refill:
+            self._refilling = True
+        return start_refill
+
+    def _start_refill(self) -> None:
+        threading.Thread(target=self._refill, name='wg-key-refill', daemon=True).start()
+
+    def warm(self) -> None:
+        '''Заполняет запас в фоне заранее, чтобы первое WireGuard-подключение не было промахом'''
+        if not WG_KEY_POOL_WARM:
+            return
+        with self._lock:
+            start_refill = self._claim_refill()
+        if start_refill:
+            self._start_refill()
+
+    def take(self) -> tuple:
+        '''Выдаёт пару из запаса; при пустом запасе генерирует её на месте и считает промах'''
+        with self._lock:
+            keypair = self._keys.popleft() if self._keys else None
+            self.stats['served'] += 1
+            if keypair is None:
+                self.stats['misses'] += 1
+            start_refill = self._claim_refill()
+
+        if start_refill:
+            self._start_refill()
+        return keypair or generate_keypair()
+
+    def _refill(self) -> None:
+        started = time.perf_counter()
+        generated = 0
+        try:
+            while len(self._keys) < self.size:
+                keypair = generate_keypair()
+                with self._lock:
+                    self._keys.append(keypair)
+                generated += 1
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self._refilling = False
+                self.stats['generated'] += generated
+                self.stats['refills'] += 1
+                if generated and elapsed > 0:
+                    self.stats['refill_rate_per_second'] = round(generated / elapsed, 1)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.stats, depth=len(self._keys), size=self.size, low_water=self.low_water,
+                        refilling=self._refilling)
+
+
+key_pool = KeyPool()
+
+
+def render_wireguard_config(private_key: str, address: str, server: dict) -> str:
+    return WIREGUARD_TEMPLATE.format(
+        private_key=private_key,
+        address=address,
+        dns=WG_DNS,
+        server_public_key=server['wg_public_key'],
+        endpoint=f'{server["ip_address"]}:{server.get("wg_port") or WG_DEFAULT_PORT}'
+    )
+
+
+def check_wireguard_server(server: dict) -> None:
+    if not server.get('wg_public_key'):
+        raise WireGuardUnavailable(f'Сервер {server["server_name"]} не поддерживает WireGuard')
@@ -0,0 +1,122 @@
+import os
+import csv
+import gzip
+import json
+import argparse
+from psycopg2.extras import RealDictCursor
+from db import get_connection
+
+SCHEMA = 't_p58863800_vpn_setup_project'
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', '2000'))
+EXPORT_FORMATS = ('ndjson', 'csv')
+EXPORT_HTTP_MAX_ROWS = int(os.environ.get('EXPORT_HTTP_MAX_ROWS', '20000'))
+
+CSV_COLUMNS = (
+    'type', 'id', 'connection_id', 'timestamp', 'event', 'details',
+    'server_name', 'vpn_ip', 'status', 'connected_at', 'disconnected_at',
+    'duration_seconds', 'bytes_sent', 'bytes_received'
+)
+
+CONNECTIONS_SQL = f'''
+    SELECT
+        'connection' AS type,
+        c.id,
+        c.id AS connection_id,
+        c.connected_at AS timestamp,
+        s.server_name,
+        c.vpn_ip,
+        c.connection_status AS status,
+        c.connected_at,
+        c.disconnected_at,
+        EXTRACT(EPOCH FROM COALESCE(c.disconnected_at, CURRENT_TIMESTAMP) - c.connected_at)::BIGINT
+            AS duration_seconds,
+        c.bytes_sent,
+        c.bytes_received
+    FROM {SCHEMA}.vpn_connections c
+    LEFT JOIN {SCHEMA}.vpn_servers s ON s.id = c.server_id
+    WHERE c.user_id = %s
+    ORDER BY c.connected_at, c.id
+'''
+
+LOGS_SQL = f'''
+    SELECT
+        'log' AS type,
+        id,
+        connection_id,
+        timestamp,
+        event_type AS event,
+        event_details AS details
+    FROM {SCHEMA}.connection_logs
+    WHERE user_id = %s
+    ORDER BY timestamp, id
+'''
+
+
+class ExportTooLarge(Exception):
+    pass
+
+
+def _serialize(row: dict) -> dict:
+    return {
+        key: value.isoformat() if hasattr(value, 'isoformat') else value
+        for key, value in row.items()
+    }
+
+
+def _stream_query(conn, sql: str, user_id, batch_size: int):
+    with conn.cursor(name=f'export_{os.getpid()}', cursor_factory=RealDictCursor) as cursor:
+        cursor.itersize = batch_size
+        cursor.execute(sql, (user_id,))
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield [_serialize(row) for row in rows]
+
+
+def export_history(conn, user_id, out, fmt: str = 'ndjson', batch_size: int = EXPORT_BATCH_SIZE,
+                   max_rows: int = None) -> int:
+    '''Пишет историю подключений и логов пользователя в out пачками из серверного курсора.
+
+    С max_rows бросает ExportTooLarge, как только история оказывается длиннее, не дочитывая её.
+    '''
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f'Неподдерживаемый формат экспорта: {fmt}')
+
+    writer = None
+    if fmt == 'csv':
+        writer = csv.DictWriter(out, fieldnames=CSV_COLUMNS, extrasaction='ignore')
+        writer.writeheader()
+
+    exported = 0
+    for sql in (CONNECTIONS_SQL, LOGS_SQL):
+        batches = _stream_query(conn, sql, user_id, batch_size)
+        for batch in batches:
+            if max_rows is not None and exported + len(batch) > max_rows:
+                batches.close()
+                conn.rollback()
+                raise ExportTooLarge(f'История длиннее {max_rows} строк')
+            if writer:
+                writer.writerows(batch)
+            else:
+                out.write(''.join(json.dumps(row, ensure_ascii=False) + '\n' for row in batch))
+            exported += len(batch)
+    conn.rollback()
+    return exported
+
+
+def export_to_file(user_id, path: str, fmt: str = 'ndjson') -> int:
+    '''Выгружает историю в файл; при расширении .gz пишет gzip'''
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'wt', encoding='utf-8', newline='') as out:
+        with get_connection() as conn:
+            return export_history(conn, user_id, out, fmt)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Экспорт истории подключений пользователя')
+    parser.add_argument('user_id', type=int)
+    parser.add_argument('path')
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default='ndjson')
+    args = parser.parse_args()
+    print(export_to_file(args.user_id, args.path, args.format))
@@ -1,90 +1,138 @@
-import json
-import os
-import psycopg2
 from psycopg2.extras import RealDictCursor
+from db import PoolExhausted, get_connection, pool_exhausted
+from log_query import build_logs_query, encode_cursor, parse_limit
+from tokens import authenticate
+from ratelimit import rate_limiter, too_many_requests
+from runtime import CORS_HEADERS, METHOD_NOT_ALLOWED, UNAUTHORIZED, respond, error, preflight, dispatch, guarded
+from tracing import traced, span
 
+PREFLIGHT = preflight('GET, OPTIONS')
+
+def list_logs(conn, cursor, user_id, query_params: dict) -> dict:
+    try:
+        sql, args, limit = build_logs_query(user_id, query_params)
+    except ValueError as e:
+        return error(400, str(e))
+
+    cursor.execute(sql, args)
+
+    logs = cursor.fetchall()
+    has_more = len(logs) > limit
+    logs = logs[:limit]
+
+    logs_list = [
+        {
+            'id': log['id'],
+            'timestamp': log['timestamp'].strftime('%H:%M:%S'),
+            'isoTimestamp': log['timestamp'].isoformat(),
+            'event': log['event_type'],
+            'details': log['event_details']
+        }
+        for log in logs
+    ]
+
+    next_cursor = encode_cursor(logs[-1]['timestamp'], logs[-1]['id']) if has_more else None
+
+    return respond(200, {
+        'success': True,
+        'logs': logs_list,
+        'nextCursor': next_cursor
+    })
+
+def usage(conn, cursor, user_id, query_params: dict) -> dict:
+    granularity = query_params.get('granularity', 'day')
+
+    if granularity not in ('hour', 'day'):
+        return error(400, 'granularity must be hour or day')
+
+    try:
+        limit = parse_limit(query_params.get('limit'))
+    except ValueError as e:
+        return error(400, str(e))
+
+    cursor.execute('''
+        SELECT bucket_start, bytes_sent, bytes_received
+        FROM t_p58863800_vpn_setup_project.traffic_rollups
+        WHERE user_id = %s AND granularity = %s
+        ORDER BY bucket_start DESC
+        LIMIT %s
+    ''', (user_id, granularity, limit))
+
+    usage_list = [
+        {
+            'bucketStart': row['bucket_start'].isoformat(),
+            'bytesSent': row['bytes_sent'],
+            'bytesReceived': row['bytes_received']
+        }
+        for row in cursor.fetchall()
+    ]
+
+    return respond(200, {
+        'success': True,
+        'granularity': granularity,
+        'usage': usage_list
+    })
+
+def export(conn, cursor, user_id, query_params: dict) -> dict:
+    import io
+    from export import EXPORT_FORMATS, EXPORT_HTTP_MAX_ROWS, ExportTooLarge, export_history
+
+    export_format = query_params.get('format', 'ndjson')
+
+    if export_format not in EXPORT_FORMATS:
+        return error(400, 'format must be ndjson or csv')
+
+    export_buffer = io.StringIO()
+    try:
+        with span('export'):
+            exported = export_history(conn, user_id, export_buffer, export_format, max_rows=EXPORT_HTTP_MAX_ROWS)
+    except ExportTooLarge as e:
+        return error(413, f'{e}: полную выгрузку делает export.py')
+
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'application/x-ndjson' if export_format == 'ndjson' else 'text/csv',
+            'Content-Disposition': f'attachment; filename="vpn-history-{user_id}.{export_format}"',
+            'X-Exported-Rows': str(exported),
+            **CORS_HEADERS
+        },
+        'body': export_buffer.getvalue(),
+        'isBase64Encoded': False
+    }
+
+ROUTES = {
+    'usage': usage,
+    'export': export
+}
+
+@traced('vpn-logs')
+@guarded({PoolExhausted: pool_exhausted})
 def handler(event: dict, context) -> dict:
     '''API для получения логов подключений пользователя'''
     method = event.get('httpMethod', 'GET')
-    
+
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, Authorization'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
-    
-    try:
-        dsn = os.environ.get('DATABASE_URL')
-        conn = psycopg2.connect(dsn)
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
-        if method == 'GET':
-            query_params = event.get('queryStringParameters') or {}
-            user_id = query_params.get('userId')
-            
-            if not user_id:
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'userId is required'}),
-                    'isBase64Encoded': False
-                }
-            
-            cursor.execute('''
-                SELECT 
-                    event_type,
-                    event_details,
-                    timestamp
-                FROM t_p58863800_vpn_setup_project.connection_logs
-                WHERE user_id = %s
-                ORDER BY timestamp DESC
-                LIMIT 50
-            ''', (user_id,))
-            
-            logs = cursor.fetchall()
-            
-            logs_list = [
-                {
-                    'timestamp': log['timestamp'].strftime('%H:%M:%S'),
-                    'event': log['event_type'],
-                    'details': log['event_details']
-                }
-                for log in logs
-            ]
-            
-            cursor.close()
-            conn.close()
-            
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({
-                    'success': True,
-                    'logs': logs_list
-                }),
-                'isBase64Encoded': False
-            }
-        
-        cursor.close()
-        conn.close()
-        
-        return {
-            'statusCode': 405,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Method not allowed'}),
-            'isBase64Encoded': False
-        }
-        
-    except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+        return PREFLIGHT
+
+    if method != 'GET':
+        return METHOD_NOT_ALLOWED
+
+    claims = authenticate(event)
+
+    if not claims:
+        return UNAUTHORIZED
+
+    user_id = claims['uid']
+
+    allowed, retry_after, _ = rate_limiter.check_local('logs', user_id=user_id)
+    if not allowed:
+        return too_many_requests(retry_after)
+
+    with get_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+        allowed, retry_after, _ = rate_limiter.check_shared(conn, 'logs', user_id=user_id)
+        if not allowed:
+            return too_many_requests(retry_after)
+
+        query_params = event.get('queryStringParameters') or {}
+        return dispatch(ROUTES, query_params.get('mode'), conn, cursor, user_id, query_params, default=list_logs)
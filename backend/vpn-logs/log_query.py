@@ -0,0 +1,72 @@
+import base64
+from datetime import datetime, timezone
+
+SCHEMA = 't_p58863800_vpn_setup_project'
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+
+def encode_cursor(timestamp: datetime, log_id: int) -> str:
+    return base64.urlsafe_b64encode(f'{timestamp.isoformat()}|{log_id}'.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        timestamp, log_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(timestamp), int(log_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('Некорректный cursor')
+
+
+def parse_timestamp(value: str, name: str) -> datetime:
+    '''Дата со смещением приводится к UTC, в котором база хранит timestamp; дата без смещения считается UTC'''
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f'Некорректная дата в параметре {name}')
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def parse_limit(value) -> int:
+    if value is None:
+        return DEFAULT_LIMIT
+    try:
+        return max(1, min(int(value), MAX_LIMIT))
+    except ValueError:
+        raise ValueError('Некорректный limit')
+
+
+def build_logs_query(user_id, query_params: dict) -> tuple:
+    '''Собирает запрос страницы логов по ключу (timestamp, id) с фильтрами since/until/eventType'''
+    conditions = ['user_id = %s']
+    args = [user_id]
+
+    if query_params.get('since'):
+        conditions.append('timestamp >= %s')
+        args.append(parse_timestamp(query_params['since'], 'since'))
+
+    if query_params.get('until'):
+        conditions.append('timestamp < %s')
+        args.append(parse_timestamp(query_params['until'], 'until'))
+
+    if query_params.get('eventType'):
+        conditions.append('event_type = %s')
+        args.append(query_params['eventType'])
+
+    if query_params.get('cursor'):
+        conditions.append('(timestamp, id) < (%s, %s)')
+        args.extend(decode_cursor(query_params['cursor']))
+
+    limit = parse_limit(query_params.get('limit'))
+    args.append(limit + 1)
+
+    sql = f'''
+        SELECT id, event_type, event_details, timestamp
+        FROM {SCHEMA}.connection_logs
+        WHERE {' AND '.join(conditions)}
+        ORDER BY timestamp DESC, id DESC
+        LIMIT %s
+    '''
+    return sql, args, limit
@@ -0,0 +1,144 @@
+import os
+import json
+import time
+import random
+import functools
+import threading
+from contextlib import contextmanager
+from psycopg2 import extensions
+
+TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', '0.01'))
+TRACE_SERVER_TIMING = os.environ.get('TRACE_SERVER_TIMING', '1') == '1'
+TRACE_SLOW_QUERIES = 3
+
+_local = threading.local()
+
+
+class Trace:
+    '''Замеры одного вызова: именованные отрезки и запросы к базе'''
+
+    def __init__(self, function: str):
+        self.function = function
+        self.started = time.perf_counter()
+        self.spans = {}
+        self.queries = []
+
+    def add_span(self, name: str, ms: float) -> None:
+        self.spans[name] = self.spans.get(name, 0.0) + ms
+
+    def add_query(self, query, ms: float) -> None:
+        self.queries.append((query, ms))
+
+    def summary(self, status) -> dict:
+        total_ms = (time.perf_counter() - self.started) * 1000
+        db_ms = sum(ms for _, ms in self.queries)
+        slowest = sorted(self.queries, key=lambda q: q[1], reverse=True)[:TRACE_SLOW_QUERIES]
+        return {
+            'trace': self.function,
+            'status': status,
+            'totalMs': round(total_ms, 3),
+            'queries': len(self.queries),
+            'dbMs': round(db_ms, 3),
+            'spans': {name: round(ms, 3) for name, ms in self.spans.items()},
+            'slowQueries': [
+                {'sql': ' '.join(_query_text(query).split())[:120], 'ms': round(ms, 3)}
+                for query, ms in slowest
+            ]
+        }
+
+
+def _query_text(query) -> str:
+    if isinstance(query, bytes):
+        return query.decode(errors='replace')
+    return str(query)
+
+
+def current_trace():
+    return getattr(_local, 'trace', None)
+
+
+@contextmanager
+def span(name: str):
+    '''Отрезок времени внутри вызова; без активной трассировки ничего не стоит'''
+    trace = getattr(_local, 'trace', None)
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add_span(name, (time.perf_counter() - started) * 1000)
+
+
+def _timed(method):
+    @functools.wraps(method)
+    def wrapper(self, query, *args, **kwargs):
+        trace = getattr(_local, 'trace', None)
+        if trace is None:
+            return method(self, query, *args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return method(self, query, *args, **kwargs)
+        finally:
+            trace.add_query(query, (time.perf_counter() - started) * 1000)
+    return wrapper
+
+
+_cursor_classes = {}
+
+
+def tracing_cursor(cursor_class):
+    '''Подкласс курсора, замеряющий execute/executemany при активной трассировке'''
+    if cursor_class not in _cursor_classes:
+        _cursor_classes[cursor_class] = type(f'Tracing{cursor_class.__name__}', (cursor_class,), {
+            'execute': _timed(cursor_class.execute),
+            'executemany': _timed(cursor_class.executemany)
+        })
+    return _cursor_classes[cursor_class]
+
+
+class TracingConnection(extensions.connection):
+    def cursor(self, *args, **kwargs):
+        kwargs['cursor_factory'] = tracing_cursor(kwargs.get('cursor_factory') or self.cursor_factory or extensions.cursor)
+        return super().cursor(*args, **kwargs)
+
+
+def _sampled(event: dict) -> bool:
+    headers = event.get('headers') or {}
+    if headers.get('X-Trace') == '1' or headers.get('x-trace') == '1':
+        return True
+    return TRACE_SAMPLE_RATE > 0 and random.random() < TRACE_SAMPLE_RATE
+
+
+def traced(function: str):
+    '''Декоратор handler: для выборки вызовов пишет строку лога с замерами и заголовок Server-Timing'''
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(event: dict, context) -> dict:
+            if not _sampled(event):
+                return handler(event, context)
+
+            _local.trace = trace = Trace(function)
+            response = None
+            try:
+                response = handler(event, context)
+            finally:
+                _local.trace = None
+                summary = trace.summary(response.get('statusCode') if response else None)
+                print(json.dumps(summary, ensure_ascii=False))
+
+            if TRACE_SERVER_TIMING:
+                response = dict(response, headers=dict(response.get('headers') or {}, **{
+                    'Server-Timing': server_timing(summary)
+                }))
+            return response
+        return wrapper
+    return decorator
+
+
+def server_timing(summary: dict) -> str:
+    entries = [f'db;dur={summary["dbMs"]};desc="{summary["queries"]} queries"']
+    entries += [f'{name};dur={ms}' for name, ms in summary['spans'].items()]
+    entries.append(f'total;dur={summary["totalMs"]}')
+    return ', '.join(entries)
@@ -0,0 +1,162 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+import psycopg2
+from psycopg2 import extensions
+from tracing import TracingConnection, span
+from runtime import error
+
+POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '4'))
+POOL_WAIT_TIMEOUT = float(os.environ.get('DB_POOL_WAIT_TIMEOUT', '5'))
+HEALTH_CHECK_IDLE_SECONDS = float(os.environ.get('DB_POOL_HEALTH_CHECK_IDLE', '30'))
+
+
+class PoolExhausted(Exception):
+    pass
+
+
+class ConnectionPool:
+    '''Ограниченный пул соединений, переживающий тёплые вызовы функции'''
+
+    def __init__(self, dsn: str, max_size: int = POOL_MAX_SIZE,
+                 wait_timeout: float = POOL_WAIT_TIMEOUT,
+                 health_check_idle: float = HEALTH_CHECK_IDLE_SECONDS):
+        self.dsn = dsn
+        self.max_size = max_size
+        self.wait_timeout = wait_timeout
+        self.health_check_idle = health_check_idle
+        self._idle = []
+        self._size = 0
+        self._cond = threading.Condition()
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'discarded': 0,
+            'waits': 0,
+            'wait_time_ms': 0.0
+        }
+
+    def _is_healthy(self, conn, idle_since: float) -> bool:
+        if conn.closed or conn.status != extensions.STATUS_READY:
+            return False
+        if time.monotonic() - idle_since < self.health_check_idle:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn) -> None:
+        self._size -= 1
+        self.stats['discarded'] += 1
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def acquire(self):
+        '''Берёт соединение; проверка простоявшего соединения идёт вне блокировки пула'''
+        started = time.monotonic()
+        waited = False
+        while True:
+            with self._cond:
+                idle = self._idle.pop() if self._idle else None
+                if idle is None:
+                    if self._size < self.max_size:
+                        self._size += 1
+                        self.stats['misses'] += 1
+                        self._record_wait(started, waited)
+                        break
+                    remaining = self.wait_timeout - (time.monotonic() - started)
+                    if remaining <= 0:
+                        self._record_wait(started, waited)
+                        raise PoolExhausted('Все соединения с базой данных заняты')
+                    waited = True
+                    self._cond.wait(remaining)
+                    continue
+
+            conn, idle_since = idle
+            if self._is_healthy(conn, idle_since):
+                with self._cond:
+                    self.stats['hits'] += 1
+                    self._record_wait(started, waited)
+                return conn
+            with self._cond:
+                self._discard(conn)
+                self._cond.notify()
+        try:
+            return psycopg2.connect(self.dsn, connection_factory=TracingConnection)
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+    def _record_wait(self, started: float, waited: bool) -> None:
+        if waited:
+            self.stats['waits'] += 1
+            self.stats['wait_time_ms'] += (time.monotonic() - started) * 1000
+
+    def release(self, conn) -> None:
+        with self._cond:
+            if not conn.closed and conn.status != extensions.STATUS_READY:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    pass
+            if conn.closed or conn.status != extensions.STATUS_READY:
+                self._discard(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        with span('pool'):
+            conn = self.acquire()
+        try:
+            yield conn
+        except Exception:
+            if not conn.closed:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    pass
+            raise
+        finally:
+            self.release(conn)
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            return dict(self.stats, size=self._size, idle=len(self._idle), max_size=self.max_size)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    '''Лениво создаёт пул при первом обращении и переиспользует его в тёплом контейнере'''
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(os.environ.get('DATABASE_URL'))
+    return _pool
+
+
+def get_connection():
+    '''Контекстный менеджер: берёт соединение из пула и всегда возвращает его обратно'''
+    return get_pool().connection()
+
+
+def pool_exhausted(e: PoolExhausted) -> dict:
+    return error(503, str(e), {'Retry-After': '1'})
+
+
+def pool_stats() -> dict:
+    return get_pool().snapshot()
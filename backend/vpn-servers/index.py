@@ -1,85 +1,83 @@
-import json
-import os
-import psycopg2
-from psycopg2.extras import RealDictCursor
+from runtime import CORS_HEADERS, METHOD_NOT_ALLOWED, respond, error, preflight, dispatch, guarded
+from servers_cache import SERVERS_CACHE_TTL, get_servers_payload, etag_matches
+from tracing import traced, span
+from db import PoolExhausted, pool_exhausted
 
-def handler(event: dict, context) -> dict:
-    '''API для получения списка VPN серверов и их статуса'''
-    method = event.get('httpMethod', 'GET')
-    
-    if method == 'OPTIONS':
+PREFLIGHT = preflight('GET, OPTIONS', 'Content-Type, If-None-Match')
+
+def list_servers(event: dict, query_params: dict) -> dict:
+    with span('payload'):
+        etag, body = get_servers_payload()
+    cache_headers = {
+        'ETag': etag,
+        'Cache-Control': f'public, max-age={int(SERVERS_CACHE_TTL)}',
+        **CORS_HEADERS,
+        'Access-Control-Expose-Headers': 'ETag'
+    }
+
+    request_headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+
+    if etag_matches(request_headers.get('if-none-match'), etag):
         return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type'
-            },
+            'statusCode': 304,
+            'headers': cache_headers,
             'body': '',
             'isBase64Encoded': False
         }
-    
+
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json', **cache_headers},
+        'body': body,
+        'isBase64Encoded': False
+    }
+
+def recommend(event: dict, query_params: dict) -> dict:
+    from recommend import RECOMMEND_CACHE_TTL, recommend_servers
+
     try:
-        dsn = os.environ.get('DATABASE_URL')
-        conn = psycopg2.connect(dsn)
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
-        if method == 'GET':
-            cursor.execute('''
-                SELECT 
-                    id, server_name, country, city, flag_emoji,
-                    ip_address, port, protocol, max_connections,
-                    current_load, ping_ms, is_active
-                FROM t_p58863800_vpn_setup_project.vpn_servers
-                WHERE is_active = true
-                ORDER BY ping_ms ASC
-            ''')
-            
-            servers = cursor.fetchall()
-            
-            servers_list = [
-                {
-                    'id': str(s['id']),
-                    'country': s['country'],
-                    'city': s['city'],
-                    'flag': s['flag_emoji'],
-                    'load': float(s['current_load']),
-                    'ping': s['ping_ms'],
-                    'serverName': s['server_name'],
-                    'ipAddress': s['ip_address'],
-                    'port': s['port'],
-                    'protocol': s['protocol']
-                }
-                for s in servers
-            ]
-            
-            cursor.close()
-            conn.close()
-            
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({
-                    'success': True,
-                    'servers': servers_list
-                }),
-                'isBase64Encoded': False
-            }
-        
-        cursor.close()
-        conn.close()
-        
-        return {
-            'statusCode': 405,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Method not allowed'}),
-            'isBase64Encoded': False
-        }
-        
-    except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
+        k = int(query_params.get('k', 3))
+    except (TypeError, ValueError):
+        return error(400, 'k must be an integer')
+
+    recommended = [
+        {
+            'id': str(s['id']),
+            'country': s['country'],
+            'city': s['city'],
+            'flag': s['flag_emoji'],
+            'load': round(s['live_load'] * 100, 1),
+            'ping': s['ping_ms'],
+            'serverName': s['server_name'],
+            'ipAddress': s['ip_address'],
+            'port': s['port'],
+            'protocol': s['protocol'],
+            'activeConnections': s['active_connections'],
+            'score': s['score']
         }
+        for s in recommend_servers(k)
+    ]
+
+    return respond(200, {
+        'success': True,
+        'servers': recommended
+    }, {'Cache-Control': f'public, max-age={int(RECOMMEND_CACHE_TTL)}'})
+
+ROUTES = {
+    'recommend': recommend
+}
+
+@traced('vpn-servers')
+@guarded({PoolExhausted: pool_exhausted})
+def handler(event: dict, context) -> dict:
+    '''API для получения списка VPN серверов и их статуса'''
+    method = event.get('httpMethod', 'GET')
+
+    if method == 'OPTIONS':
+        return PREFLIGHT
+
+    if method != 'GET':
+        return METHOD_NOT_ALLOWED
+
+    query_params = event.get('queryStringParameters') or {}
+    return dispatch(ROUTES, query_params.get('mode'), event, query_params, default=list_servers)
@@ -0,0 +1,77 @@
+import os
+import time
+import hashlib
+import threading
+from psycopg2.extras import RealDictCursor
+from db import get_connection
+from runtime import dumps
+
+SCHEMA = 't_p58863800_vpn_setup_project'
+SERVERS_CACHE_TTL = float(os.environ.get('SERVERS_CACHE_TTL', '10'))
+CONNECT_RATE_WINDOW = 300
+
+_cache = {'etag': None, 'body': None, 'checked_at': 0.0}
+_cache_lock = threading.Lock()
+
+
+def _load_servers(cursor) -> str:
+    cursor.execute(f'''
+        SELECT
+            s.id, s.server_name, s.country, s.city, s.flag_emoji,
+            s.ip_address, s.port, s.protocol, s.max_connections, s.ping_ms,
+            COALESCE(st.active_connections, 0) AS active_connections,
+            LEAST(100, ROUND(100.0 * COALESCE(st.active_connections, 0) / GREATEST(s.max_connections, 1), 1)) AS live_load,
+            COALESCE(st.connect_rate, 0) * 60 / {CONNECT_RATE_WINDOW} AS connects_per_minute
+        FROM {SCHEMA}.vpn_servers s
+        LEFT JOIN {SCHEMA}.server_live_totals st ON st.server_id = s.id
+        WHERE s.is_active = true
+        ORDER BY s.ping_ms ASC
+    ''')
+
+    servers_list = [
+        {
+            'id': str(s['id']),
+            'country': s['country'],
+            'city': s['city'],
+            'flag': s['flag_emoji'],
+            'load': float(s['live_load']),
+            'activeConnections': s['active_connections'],
+            'connectsPerMinute': round(float(s['connects_per_minute']), 1),
+            'ping': s['ping_ms'],
+            'serverName': s['server_name'],
+            'ipAddress': s['ip_address'],
+            'port': s['port'],
+            'protocol': s['protocol']
+        }
+        for s in cursor.fetchall()
+    ]
+
+    return dumps({
+        'success': True,
+        'servers': servers_list
+    })
+
+
+def get_servers_payload() -> tuple:
+    '''Возвращает ETag и сериализованный список серверов с живой нагрузкой, перечитывая его раз в TTL'''
+    with _cache_lock:
+        if _cache['body'] is not None and time.monotonic() - _cache['checked_at'] < SERVERS_CACHE_TTL:
+            return _cache['etag'], _cache['body']
+
+        with get_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            body = _load_servers(cursor)
+
+        if body != _cache['body']:
+            _cache['body'] = body
+            _cache['etag'] = '"' + hashlib.sha256(body.encode()).hexdigest()[:32] + '"'
+
+        _cache['checked_at'] = time.monotonic()
+        return _cache['etag'], _cache['body']
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    return etag in (tag.strip() for tag in if_none_match.split(','))
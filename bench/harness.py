@@ -0,0 +1,407 @@
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import importlib
+import threading
+import subprocess
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.extras import execute_values
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND = os.path.join(ROOT, 'backend')
+MIGRATIONS = os.path.join(ROOT, 'db_migrations')
+SCHEMA = 't_p58863800_vpn_setup_project'
+BENCH_PASSWORD = 'bench-password'
+
+_counter = threading.local()
+
+
+def _count_query() -> None:
+    _counter.queries = getattr(_counter, 'queries', 0) + 1
+
+
+def _counting(cursor_class):
+    '''Подкласс курсора, считающий запросы в текущем потоке'''
+
+    class CountingCursor(cursor_class):
+        def execute(self, query, vars=None):
+            _count_query()
+            return super().execute(query, vars)
+
+        def executemany(self, query, vars_list):
+            _count_query()
+            return super().executemany(query, vars_list)
+
+        def callproc(self, procname, parameters=None):
+            _count_query()
+            return super().callproc(procname, parameters)
+
+    CountingCursor.__name__ = f'Counting{cursor_class.__name__}'
+    return CountingCursor
+
+
+_connection_classes = {}
+
+
+def _counting_connection(connection_class):
+    '''Подкласс соединения, подставляющий считающий курсор поверх фабрики функции'''
+    if connection_class not in _connection_classes:
+        cursor_classes = {}
+
+        def cursor(self, *args, **kwargs):
+            cursor_class = kwargs.get('cursor_factory') or self.cursor_factory or extensions.cursor
+            if cursor_class not in cursor_classes:
+                cursor_classes[cursor_class] = _counting(cursor_class)
+            kwargs['cursor_factory'] = cursor_classes[cursor_class]
+            return connection_class.cursor(self, *args, **kwargs)
+
+        _connection_classes[connection_class] = type(f'Counting{connection_class.__name__}',
+                                                     (connection_class,), {'cursor': cursor})
+    return _connection_classes[connection_class]
+
+
+def install_query_counter() -> None:
+    '''Подменяет psycopg2.connect так, чтобы пулы функций получали считающие соединения'''
+    connect = psycopg2.connect
+
+    def counting_connect(*args, **kwargs):
+        kwargs['connection_factory'] = _counting_connection(kwargs.get('connection_factory') or extensions.connection)
+        return connect(*args, **kwargs)
+
+    psycopg2.connect = counting_connect
+
+
+def _local_modules(folder: str) -> list:
+    return [f[:-3] for f in os.listdir(folder) if f.endswith('.py')]
+
+
+@contextmanager
+def function_scope(name: str, modules: dict):
+    '''Делает папку и модули функции видимыми, чтобы ленивые импорты внутри обработчика находили свои модули'''
+    folder = os.path.join(BACKEND, name)
+    local = _local_modules(folder)
+    for module in local:
+        sys.modules.pop(module, None)
+    sys.modules.update(modules)
+    sys.path.insert(0, folder)
+    try:
+        yield modules
+    finally:
+        sys.path.remove(folder)
+        for module in local:
+            if module in sys.modules:
+                modules[module] = sys.modules.pop(module)
+
+
+def load_function(name: str) -> dict:
+    '''Импортирует index.py функции вместе с её модулями, не смешивая одноимённые db/tokens/... разных функций'''
+    modules = {}
+    with function_scope(name, modules):
+        importlib.import_module('index')
+    return modules
+
+
+def setup_database(dsn: str, users: int, logs_per_user: int, reset: bool) -> None:
+    '''Накатывает db_migrations по порядку и заполняет базу пользователями и логами'''
+    sys.path.insert(0, os.path.join(BACKEND, 'vpn-auth'))
+    try:
+        from passwords import hash_password_sync
+    finally:
+        sys.path.pop(0)
+    password_hash = hash_password_sync(BENCH_PASSWORD)
+
+    conn = psycopg2.connect(dsn)
+    with conn.cursor() as cursor:
+        if reset:
+            cursor.execute(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE')
+        cursor.execute(f'CREATE SCHEMA IF NOT EXISTS {SCHEMA}')
+        cursor.execute(f"SELECT to_regclass('{SCHEMA}.users') IS NOT NULL")
+        migrated = cursor.fetchone()[0]
+        if not migrated:
+            for migration in sorted(os.listdir(MIGRATIONS)):
+                with open(os.path.join(MIGRATIONS, migration), encoding='utf-8') as f:
+                    cursor.execute(f.read())
+
+        execute_values(cursor, f'''
+            INSERT INTO {SCHEMA}.users (email, password_hash, username, subscription_tier)
+            VALUES %s
+            ON CONFLICT (email) DO NOTHING
+        ''', [(f'bench{i}@bench.local', password_hash, f'bench_user_{i}', 'premium') for i in range(users)],
+            page_size=1000)
+
+        cursor.execute(f'''
+            INSERT INTO {SCHEMA}.connection_logs (user_id, event_type, event_details, timestamp)
+            SELECT u.id, 'Подключение', 'Нагрузочный тест', CURRENT_TIMESTAMP - n * INTERVAL '1 minute'
+            FROM {SCHEMA}.users u
+            CROSS JOIN generate_series(1, %s) n
+            WHERE u.email LIKE 'bench%%@bench.local'
+              AND NOT EXISTS (SELECT 1 FROM {SCHEMA}.connection_logs l WHERE l.user_id = u.id)
+        ''', (logs_per_user,))
+    conn.commit()
+    conn.close()
+
+
+def bench_users(dsn: str) -> tuple:
+    conn = psycopg2.connect(dsn)
+    with conn.cursor() as cursor:
+        cursor.execute(f'''
+            SELECT id, username, email FROM {SCHEMA}.users
+            WHERE email LIKE 'bench%%@bench.local'
+            ORDER BY id
+        ''')
+        rows = cursor.fetchall()
+        cursor.execute(f'SELECT id FROM {SCHEMA}.vpn_servers WHERE is_active = true ORDER BY id')
+        servers = [row[0] for row in cursor.fetchall()]
+    conn.close()
+    return rows, servers
+
+
+def close_bench_sessions(dsn: str) -> None:
+    conn = psycopg2.connect(dsn)
+    with conn.cursor() as cursor:
+        cursor.execute(f'''
+            UPDATE {SCHEMA}.vpn_connections
+            SET connection_status = 'disconnected', disconnected_at = CURRENT_TIMESTAMP
+            WHERE connection_status = 'connected'
+              AND user_id IN (SELECT id FROM {SCHEMA}.users WHERE email LIKE 'bench%%@bench.local')
+        ''')
+    conn.commit()
+    conn.close()
+
+
+def call(handler, event: dict) -> tuple:
+    '''Вызывает обработчик и возвращает (ответ, миллисекунды, число запросов к базе)'''
+    _counter.queries = 0
+    started = time.perf_counter()
+    response = handler(event, None)
+    return response, (time.perf_counter() - started) * 1000, _counter.queries
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))
+    return round(ordered[rank], 3)
+
+
+def summarize(samples: list, wall_seconds: float) -> dict:
+    latencies = [s[1] for s in samples]
+    statuses = {}
+    for status, _, _ in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        'requests': len(samples),
+        'throughputRps': round(len(samples) / wall_seconds, 2) if wall_seconds else 0.0,
+        'latencyMs': {
+            'mean': round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+            'max': round(max(latencies), 3) if latencies else 0.0
+        },
+        'queriesPerRequest': round(sum(s[2] for s in samples) / len(samples), 2) if samples else 0.0,
+        'statuses': statuses
+    }
+
+
+def auth_event(token: str, method: str = 'POST', body=None, query=None, headers=None) -> dict:
+    return {
+        'httpMethod': method,
+        'headers': {'X-Auth-Token': token, **(headers or {})},
+        'queryStringParameters': query,
+        'body': json.dumps(body) if body is not None else None,
+        'requestContext': {'identity': {'sourceIp': '127.0.0.1'}}
+    }
+
+
+def scenario_server_burst(functions: dict, ctx: dict, i: int) -> list:
+    handler = functions['vpn-servers']['index'].handler
+    headers = {'If-None-Match': ctx['etag']} if ctx.get('etag') and i % 2 else {}
+    response, ms, queries = call(handler, {'httpMethod': 'GET', 'headers': headers})
+    if response['statusCode'] == 200:
+        ctx['etag'] = response['headers'].get('ETag')
+    return [('list', response['statusCode'], ms, queries)]
+
+
+def scenario_log_polling(functions: dict, ctx: dict, i: int) -> list:
+    handler = functions['vpn-logs']['index'].handler
+    token = ctx['tokens'][i % len(ctx['tokens'])]
+    response, ms, queries = call(handler, auth_event(token, 'GET', query={'limit': '50'}))
+    samples = [('first_page', response['statusCode'], ms, queries)]
+    if response['statusCode'] == 200:
+        next_cursor = json.loads(response['body']).get('nextCursor')
+        if next_cursor:
+            response, ms, queries = call(handler, auth_event(token, 'GET', query={'limit': '50', 'cursor': next_cursor}))
+            samples.append(('next_page', response['statusCode'], ms, queries))
+    return samples
+
+
+def scenario_connect_storm(functions: dict, ctx: dict, i: int) -> list:
+    handler = functions['vpn-connect']['index'].handler
+    token = ctx['tokens'][i % len(ctx['tokens'])]
+    server_id = 'auto' if i % 4 == 0 else random.choice(ctx['servers'])
+    response, ms, queries = call(handler, auth_event(token, body={
+        'action': 'connect', 'serverId': server_id, 'protocol': 'OpenVPN', 'encryption': 'AES-256-GCM'
+    }))
+    samples = [('connect', response['statusCode'], ms, queries)]
+    if response['statusCode'] == 200:
+        connection_id = json.loads(response['body'])['connectionId']
+        response, ms, queries = call(handler, auth_event(token, body={
+            'action': 'disconnect', 'connectionId': connection_id
+        }))
+        samples.append(('disconnect', response['statusCode'], ms, queries))
+    return samples
+
+
+def scenario_auth_login(functions: dict, ctx: dict, i: int) -> list:
+    handler = functions['vpn-auth']['index'].handler
+    _, _, email = ctx['users'][i % len(ctx['users'])]
+    response, ms, queries = call(handler, {
+        'httpMethod': 'POST',
+        'body': json.dumps({'action': 'login', 'email': email, 'password': BENCH_PASSWORD}),
+        'requestContext': {'identity': {'sourceIp': f'10.0.{i % 250}.{i % 200}'}}
+    })
+    return [('login', response['statusCode'], ms, queries)]
+
+
+SCENARIOS = {
+    'server_burst': scenario_server_burst,
+    'log_polling': scenario_log_polling,
+    'connect_storm': scenario_connect_storm,
+    'auth_login': scenario_auth_login
+}
+
+SCENARIO_FUNCTIONS = {
+    'server_burst': 'vpn-servers',
+    'log_polling': 'vpn-logs',
+    'connect_storm': 'vpn-connect',
+    'auth_login': 'vpn-auth'
+}
+
+
+def run_scenario(name: str, functions: dict, ctx: dict, requests: int, concurrency: int) -> dict:
+    '''Гоняет сценарий в concurrency потоках и сводит замеры по операциям'''
+    scenario = SCENARIOS[name]
+    for i in range(min(concurrency, requests)):
+        scenario(functions, ctx, i)
+
+    samples = {}
+    lock = threading.Lock()
+
+    def task(i):
+        for operation, status, ms, queries in scenario(functions, ctx, i):
+            with lock:
+                samples.setdefault(operation, []).append((status, ms, queries))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(task, range(requests)))
+    wall = time.perf_counter() - started
+
+    return {
+        'concurrency': concurrency,
+        'wallSeconds': round(wall, 3),
+        'operations': {operation: summarize(op_samples, wall) for operation, op_samples in samples.items()}
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(result: dict, baseline: dict) -> list:
+    '''Строки сравнения p95 и запросов на вызов с предыдущим прогоном'''
+    lines = []
+    for name, scenario in result['scenarios'].items():
+        for operation, stats in scenario['operations'].items():
+            before = baseline.get('scenarios', {}).get(name, {}).get('operations', {}).get(operation)
+            if not before:
+                continue
+            p95_before, p95_after = before['latencyMs']['p95'], stats['latencyMs']['p95']
+            change = (p95_after - p95_before) / p95_before * 100 if p95_before else 0.0
+            lines.append(f'{name}.{operation}: p95 {p95_before} -> {p95_after} ms ({change:+.1f}%), '
+                         f'queries {before["queriesPerRequest"]} -> {stats["queriesPerRequest"]}')
+    return lines
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Нагрузочный стенд для обработчиков VPN-функций')
+    parser.add_argument('--dsn', default=os.environ.get('BENCH_DATABASE_URL') or os.environ.get('DATABASE_URL'))
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help='можно указать несколько раз; по умолчанию все')
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--logs-per-user', type=int, default=300)
+    parser.add_argument('--reset', action='store_true', help='пересоздать схему перед прогоном')
+    parser.add_argument('--output', help='куда записать JSON с результатами')
+    parser.add_argument('--baseline', help='JSON предыдущего прогона для сравнения')
+    args = parser.parse_args()
+
+    if not args.dsn:
+        parser.error('нужен --dsn или BENCH_DATABASE_URL с адресом локального Postgres')
+
+    os.environ['DATABASE_URL'] = args.dsn
+    os.environ.setdefault('SESSION_TOKEN_SECRET', 'bench-secret')
+    os.environ.setdefault('RATE_LIMITS_JSON', '{}')
+    os.environ.setdefault('DB_POOL_MAX_SIZE', str(args.concurrency))
+
+    setup_database(args.dsn, args.users, args.logs_per_user, args.reset)
+    users, servers = bench_users(args.dsn)
+
+    install_query_counter()
+    functions = {name: load_function(name) for name in ('vpn-auth', 'vpn-connect', 'vpn-logs', 'vpn-servers')}
+    issue_token = functions['vpn-connect']['tokens'].issue_token
+    ctx = {
+        'users': users,
+        'servers': servers,
+        'tokens': [issue_token(user_id, username, 'premium') for user_id, username, _ in users]
+    }
+
+    result = {
+        'revision': git_revision(),
+        'startedAt': datetime.now(timezone.utc).isoformat(),
+        'settings': {
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'users': len(users),
+            'logsPerUser': args.logs_per_user
+        },
+        'scenarios': {}
+    }
+    for name in args.scenario or list(SCENARIOS):
+        function = SCENARIO_FUNCTIONS[name]
+        with function_scope(function, functions[function]):
+            result['scenarios'][name] = run_scenario(name, functions, ctx, args.requests, args.concurrency)
+        if name == 'connect_storm':
+            close_bench_sessions(args.dsn)
+
+    result['pools'] = {name: modules['db'].pool_stats() for name, modules in functions.items()}
+
+    output = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            for line in compare(result, json.load(f)):
+                print(line, file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,17 @@
+-- Shared config templates addressed by content hash
+
+CREATE TABLE IF NOT EXISTS t_p58863800_vpn_setup_project.config_templates (
+    content_hash CHAR(64) PRIMARY KEY,
+    template_body BYTEA NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Per-user delta stored compressed next to a reference to its template
+ALTER TABLE t_p58863800_vpn_setup_project.vpn_configs
+    ADD COLUMN IF NOT EXISTS template_hash CHAR(64) REFERENCES t_p58863800_vpn_setup_project.config_templates(content_hash);
+
+ALTER TABLE t_p58863800_vpn_setup_project.vpn_configs
+    ADD COLUMN IF NOT EXISTS config_delta BYTEA;
+
+-- Index for batched purge of expired configs
+CREATE INDEX IF NOT EXISTS idx_vpn_configs_expires_at ON t_p58863800_vpn_setup_project.vpn_configs(expires_at);
@@ -0,0 +1,17 @@
+-- Close duplicate active sessions that share a VPN address on the same server, keeping the newest one
+UPDATE t_p58863800_vpn_setup_project.vpn_connections c
+SET connection_status = 'disconnected',
+    disconnected_at = COALESCE(c.disconnected_at, CURRENT_TIMESTAMP)
+WHERE c.connection_status = 'connected'
+  AND EXISTS (
+      SELECT 1 FROM t_p58863800_vpn_setup_project.vpn_connections d
+      WHERE d.server_id = c.server_id
+        AND d.vpn_ip = c.vpn_ip
+        AND d.connection_status = 'connected'
+        AND d.id > c.id
+  );
+
+-- One active session per VPN address per server; also serves the address pool seed query
+CREATE UNIQUE INDEX IF NOT EXISTS uq_vpn_connections_active_ip
+    ON t_p58863800_vpn_setup_project.vpn_connections(server_id, vpn_ip)
+    WHERE connection_status = 'connected';
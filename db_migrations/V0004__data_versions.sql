@@ -0,0 +1,28 @@
+-- Version stamps that change whenever a cached table changes
+
+CREATE TABLE IF NOT EXISTS t_p58863800_vpn_setup_project.data_versions (
+    name VARCHAR(100) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 1,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO t_p58863800_vpn_setup_project.data_versions (name, version)
+VALUES ('vpn_servers', 1)
+ON CONFLICT (name) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION t_p58863800_vpn_setup_project.bump_vpn_servers_version()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE t_p58863800_vpn_setup_project.data_versions
+    SET version = version + 1,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE name = 'vpn_servers';
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_vpn_servers_version ON t_p58863800_vpn_setup_project.vpn_servers;
+
+CREATE TRIGGER trg_vpn_servers_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON t_p58863800_vpn_setup_project.vpn_servers
+FOR EACH STATEMENT EXECUTE FUNCTION t_p58863800_vpn_setup_project.bump_vpn_servers_version();
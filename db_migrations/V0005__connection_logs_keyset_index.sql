@@ -0,0 +1,6 @@
+-- Composite index for keyset pagination of a user's logs by (timestamp, id)
+CREATE INDEX IF NOT EXISTS idx_connection_logs_user_timestamp_id
+    ON t_p58863800_vpn_setup_project.connection_logs(user_id, timestamp DESC, id DESC);
+
+-- Superseded by the composite index above
+DROP INDEX IF EXISTS t_p58863800_vpn_setup_project.idx_connection_logs_user_id;
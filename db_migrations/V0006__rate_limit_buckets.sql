@@ -0,0 +1,9 @@
+-- Shared token buckets for rate limiting across function containers.
+-- UNLOGGED: losing bucket state on crash only resets limits, and skips WAL on every request.
+CREATE UNLOGGED TABLE IF NOT EXISTS t_p58863800_vpn_setup_project.rate_limit_buckets (
+    bucket_key VARCHAR(255) PRIMARY KEY,
+    tokens DOUBLE PRECISION NOT NULL,
+    capacity DOUBLE PRECISION NOT NULL,
+    rate DOUBLE PRECISION NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp()
+);
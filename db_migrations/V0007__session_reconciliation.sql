@@ -0,0 +1,11 @@
+-- Last activity reported for a session; stale sessions are closed by the sweeper
+ALTER TABLE t_p58863800_vpn_setup_project.vpn_connections
+    ADD COLUMN IF NOT EXISTS last_seen_at TIMESTAMP;
+
+-- Only active sessions are scanned for staleness
+CREATE INDEX IF NOT EXISTS idx_vpn_connections_active_last_seen
+    ON t_p58863800_vpn_setup_project.vpn_connections((COALESCE(last_seen_at, connected_at)))
+    WHERE connection_status = 'connected';
+
+-- Active-session lookups use the partial indexes; the full status index only grows
+DROP INDEX IF EXISTS t_p58863800_vpn_setup_project.idx_vpn_connections_status;
@@ -0,0 +1,9 @@
+-- Per-user traffic totals, maintained incrementally by the traffic ingest action
+CREATE TABLE IF NOT EXISTS t_p58863800_vpn_setup_project.traffic_rollups (
+    user_id INTEGER NOT NULL REFERENCES t_p58863800_vpn_setup_project.users(id),
+    granularity VARCHAR(10) NOT NULL,
+    bucket_start TIMESTAMP NOT NULL,
+    bytes_sent BIGINT NOT NULL DEFAULT 0,
+    bytes_received BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, granularity, bucket_start)
+);
@@ -0,0 +1,4 @@
+-- WireGuard endpoint of each server; servers without a public key serve OpenVPN only
+ALTER TABLE t_p58863800_vpn_setup_project.vpn_servers
+    ADD COLUMN IF NOT EXISTS wg_public_key VARCHAR(64),
+    ADD COLUMN IF NOT EXISTS wg_port INTEGER DEFAULT 51820;
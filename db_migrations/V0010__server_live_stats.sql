@@ -0,0 +1,80 @@
+-- Live per-server counters, maintained by a trigger on vpn_connections so reads never aggregate sessions.
+-- Each server's counters are spread over 16 slot rows picked at random per change, so concurrent connects
+-- to one server rarely wait on the same row lock; server_live_totals sums the slots on read.
+-- connect_rate is an exponentially decayed connect count with a 300-second time constant.
+
+CREATE TABLE IF NOT EXISTS t_p58863800_vpn_setup_project.server_live_stats (
+    server_id INTEGER NOT NULL REFERENCES t_p58863800_vpn_setup_project.vpn_servers(id),
+    slot SMALLINT NOT NULL,
+    active_connections INTEGER NOT NULL DEFAULT 0,
+    connects_total BIGINT NOT NULL DEFAULT 0,
+    connect_rate DOUBLE PRECISION NOT NULL DEFAULT 0,
+    rate_updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (server_id, slot)
+);
+
+INSERT INTO t_p58863800_vpn_setup_project.server_live_stats (server_id, slot, active_connections)
+SELECT s.id, 0, COUNT(c.id)
+FROM t_p58863800_vpn_setup_project.vpn_servers s
+LEFT JOIN t_p58863800_vpn_setup_project.vpn_connections c
+    ON c.server_id = s.id AND c.connection_status = 'connected'
+GROUP BY s.id
+ON CONFLICT (server_id, slot) DO UPDATE SET active_connections = EXCLUDED.active_connections;
+
+CREATE OR REPLACE VIEW t_p58863800_vpn_setup_project.server_live_totals AS
+SELECT
+    server_id,
+    GREATEST(SUM(active_connections), 0)::INTEGER AS active_connections,
+    SUM(connects_total)::BIGINT AS connects_total,
+    SUM(connect_rate * exp(-LEAST(EXTRACT(EPOCH FROM CURRENT_TIMESTAMP - rate_updated_at) / 300, 50)))
+        AS connect_rate
+FROM t_p58863800_vpn_setup_project.server_live_stats
+GROUP BY server_id;
+
+CREATE OR REPLACE FUNCTION t_p58863800_vpn_setup_project.adjust_server_live_stats(
+    p_server_id INTEGER, p_active_delta INTEGER, p_connects INTEGER
+) RETURNS VOID AS $$
+BEGIN
+    INSERT INTO t_p58863800_vpn_setup_project.server_live_stats AS st
+    (server_id, slot, active_connections, connects_total, connect_rate, rate_updated_at)
+    VALUES (p_server_id, floor(random() * 16)::SMALLINT, p_active_delta, p_connects, p_connects, clock_timestamp())
+    ON CONFLICT (server_id, slot) DO UPDATE SET
+        active_connections = st.active_connections + p_active_delta,
+        connects_total = st.connects_total + p_connects,
+        connect_rate = st.connect_rate
+            * exp(-LEAST(EXTRACT(EPOCH FROM clock_timestamp() - st.rate_updated_at) / 300, 50)) + p_connects,
+        rate_updated_at = clock_timestamp();
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION t_p58863800_vpn_setup_project.track_server_live_stats()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        IF NEW.connection_status = 'connected' THEN
+            PERFORM t_p58863800_vpn_setup_project.adjust_server_live_stats(NEW.server_id, 1, 1);
+        END IF;
+    ELSIF TG_OP = 'UPDATE' THEN
+        IF OLD.connection_status = 'connected' AND NEW.connection_status IS DISTINCT FROM 'connected' THEN
+            PERFORM t_p58863800_vpn_setup_project.adjust_server_live_stats(OLD.server_id, -1, 0);
+        ELSIF NEW.connection_status = 'connected' AND OLD.connection_status IS DISTINCT FROM 'connected' THEN
+            PERFORM t_p58863800_vpn_setup_project.adjust_server_live_stats(NEW.server_id, 1, 0);
+        END IF;
+    ELSIF OLD.connection_status = 'connected' THEN
+        PERFORM t_p58863800_vpn_setup_project.adjust_server_live_stats(OLD.server_id, -1, 0);
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_vpn_connections_live_stats ON t_p58863800_vpn_setup_project.vpn_connections;
+
+CREATE TRIGGER trg_vpn_connections_live_stats
+AFTER INSERT OR UPDATE OF connection_status OR DELETE ON t_p58863800_vpn_setup_project.vpn_connections
+FOR EACH ROW EXECUTE FUNCTION t_p58863800_vpn_setup_project.track_server_live_stats();
+
+-- The server list now reads live load from server_live_totals instead of a version stamp.
+DROP TRIGGER IF EXISTS trg_vpn_servers_version ON t_p58863800_vpn_setup_project.vpn_servers;
+DROP FUNCTION IF EXISTS t_p58863800_vpn_setup_project.bump_vpn_servers_version();
+DROP TABLE IF EXISTS t_p58863800_vpn_setup_project.data_versions;
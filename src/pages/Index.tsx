@@ -46,6 +46,7 @@ interface User {
   email: string;
   username: string;
   subscription_tier: string;
+  token?: string;
 }
 
 export default function Index() {
@@ -112,8 +113,9 @@ export default function Index() {
       const data = await response.json();
       
       if (data.success && data.user) {
-        setUser(data.user);
-        localStorage.setItem('vpn_user', JSON.stringify(data.user));
+        const authedUser: User = { ...data.user, token: data.token };
+        setUser(authedUser);
+        localStorage.setItem('vpn_user', JSON.stringify(authedUser));
         setShowAuthDialog(false);
         toast({
           title: 'Успешно',
@@ -169,16 +171,23 @@ export default function Index() {
       try {
         const response = await fetch(API_URLS.connect, {
           method: 'POST',
-          headers: { 'Content-Type': 'application/json' },
+          headers: { 'Content-Type': 'application/json', 'X-Auth-Token': user.token ?? '' },
           body: JSON.stringify({
             action: 'connect',
-            userId: user.id,
             serverId: selectedServer.id,
             protocol,
             encryption
           })
         });
 
+        if (response.status === 401) {
+          localStorage.removeItem('vpn_user');
+          setUser(null);
+          setStatus('disconnected');
+          setShowAuthDialog(true);
+          return;
+        }
+
         const data = await response.json();
         
         if (data.success) {
@@ -218,10 +227,9 @@ export default function Index() {
       try {
         await fetch(API_URLS.connect, {
           method: 'POST',
-          headers: { 'Content-Type': 'application/json' },
+          headers: { 'Content-Type': 'application/json', 'X-Auth-Token': user.token ?? '' },
           body: JSON.stringify({
             action: 'disconnect',
-            userId: user.id,
             connectionId
           })
         });